@@ -0,0 +1,10 @@
+# Benchmarks for the AERIS node server.
+#
+# These run outside of Polyglot, so if polyinterface isn't installed
+# use the mock version so the nodes modules can be imported.
+
+try:
+    import polyinterface
+except ImportError:
+    from benchmarks import mock_poly
+    polyinterface = mock_poly.install()
@@ -0,0 +1,122 @@
+# Compare the scalar and batch ETo calculations.
+#
+# Builds a set of day/location pairs with random (but repeatable)
+# weather, works out ETo for each of them with the scalar
+# evapotranspriation() one call at a time and with
+# evapotranspiration_batch() in one call, and reports the time taken
+# by each.  The batch results are checked against the scalar ones and
+# the benchmark fails if any differ by more than TOLERANCE.
+#
+# usage: python3 -m benchmarks.bench_eto [--locations N] [--days N]
+#                                        [--iterations N] [--crops N]
+
+import sys
+import math
+import time
+import random
+import argparse
+
+import benchmarks
+from nodes import et3
+
+TOLERANCE = 1e-9
+
+# Weather for every day of the year at a set of locations
+def make_inputs(locations, days, seed=1):
+    rng = random.Random(seed)
+    inputs = {
+        'max_t': [], 'min_t': [], 'solar_radiation': [], 'avg_ws': [],
+        'elevation': [], 'max_h': [], 'min_h': [], 'latitude': [], 'day': [],
+    }
+    for l in range(locations):
+        latitude = rng.uniform(-60, 60)
+        elevation = rng.uniform(0, 2000)
+        for d in range(days):
+            min_t = rng.uniform(-10, 25)
+            min_h = rng.uniform(10, 60)
+            inputs['min_t'].append(min_t)
+            inputs['max_t'].append(min_t + rng.uniform(1, 15))
+            inputs['min_h'].append(min_h)
+            inputs['max_h'].append(min(100, min_h + rng.uniform(5, 40)))
+            inputs['avg_ws'].append(rng.uniform(0, 10))
+            # Measured solar radiation for some days, estimated for the rest
+            inputs['solar_radiation'].append(rng.uniform(50, 350) if rng.random() < 0.5 else float('nan'))
+            inputs['elevation'].append(elevation)
+            inputs['latitude'].append(latitude)
+            inputs['day'].append(d % 365 + 1)
+    return inputs
+
+def scalar(inputs, coefficients):
+    results = []
+    for i in range(len(inputs['day'])):
+        sr = inputs['solar_radiation'][i]
+        row = []
+        for c in coefficients:
+            row.append(et3.evapotranspriation(inputs['max_t'][i], inputs['min_t'][i],
+                                              None if math.isnan(sr) else sr,
+                                              inputs['avg_ws'][i], inputs['elevation'][i],
+                                              inputs['max_h'][i], inputs['min_h'][i],
+                                              inputs['latitude'][i], c, inputs['day'][i]))
+        results.append(row)
+    return results
+
+def batch(inputs, coefficients):
+    return et3.evapotranspiration_batch(inputs['max_t'], inputs['min_t'], inputs['solar_radiation'],
+                                        inputs['avg_ws'], inputs['elevation'], inputs['max_h'],
+                                        inputs['min_h'], inputs['latitude'], coefficients, inputs['day'])
+
+def loop(inputs, coefficients):
+    return et3._evapotranspiration_loop(inputs['max_t'], inputs['min_t'], inputs['solar_radiation'],
+                                        inputs['avg_ws'], inputs['elevation'], inputs['max_h'],
+                                        inputs['min_h'], inputs['latitude'], coefficients, inputs['day'])
+
+def best_time(run, iterations):
+    best = None
+    for i in range(iterations):
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return (best, result)
+
+# Largest difference between two sets of results
+def max_difference(expected, actual):
+    worst = 0.0
+    for (row_e, row_a) in zip(expected, actual):
+        for (e, a) in zip(row_e, row_a):
+            worst = max(worst, abs(e - float(a)))
+    return worst
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='bench_eto', description='Time scalar and batch ETo')
+    parser.add_argument('--locations', type=int, default=10)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--crops', type=int, default=3, help='number of crop coefficients')
+    args = parser.parse_args()
+
+    inputs = make_inputs(args.locations, args.days)
+    coefficients = [0.23 + 0.1 * c for c in range(args.crops)]
+    pairs = len(inputs['day'])
+
+    (t_scalar, expected) = best_time(lambda: scalar(inputs, coefficients), args.iterations)
+    (t_loop, looped) = best_time(lambda: loop(inputs, coefficients), args.iterations)
+    print('%d day/location pairs, %d crop coefficients' % (pairs, len(coefficients)))
+    print('%-8s %10.1f ms %8.2f us/pair' % ('scalar', t_scalar * 1000, t_scalar / pairs * 1e6))
+    print('%-8s %10.1f ms %8.2f us/pair' % ('loop', t_loop * 1000, t_loop / pairs * 1e6))
+
+    failed = max_difference(expected, looped) > TOLERANCE
+
+    if et3.numpy is None:
+        print('numpy is not installed, skipping the vectorized batch')
+    else:
+        (t_batch, result) = best_time(lambda: batch(inputs, coefficients), args.iterations)
+        difference = max_difference(expected, result.tolist())
+        print('%-8s %10.1f ms %8.2f us/pair  %.1fx faster, max difference %.2e' %
+              ('batch', t_batch * 1000, t_batch / pairs * 1e6, t_scalar / t_batch, difference))
+        failed = failed or difference > TOLERANCE
+
+    if failed:
+        print('batch results differ from the scalar results')
+        sys.exit(1)
@@ -0,0 +1,36 @@
+# Measure the effect of field projection on payload size and decode
+# time.
+#
+# The canned responses are trimmed to the fields= lists the controller
+# requests, the same way the AERIS server does, and the size and
+# json.loads time of the full and trimmed payloads are compared.
+#
+# usage: python3 -m benchmarks.bench_fields [iterations]
+
+import sys
+import json
+import timeit
+
+import benchmarks
+from benchmarks import payloads
+from nodes import uom
+
+RESPONSES = {
+    'observations': payloads.OBSERVATIONS,
+    'forecasts': payloads.FORECASTS,
+}
+
+def decode_time(body, iterations):
+    return timeit.timeit(lambda: json.loads(body), number=iterations) / iterations * 1e6
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    for units in uom.PROFILES:
+        selected = uom.PROFILES[units].fields
+        for extra in RESPONSES:
+            full = payloads.encode(RESPONSES[extra])
+            trimmed = payloads.encode(payloads.project(RESPONSES[extra], selected[extra]))
+            print('%-8s %-12s bytes %6d -> %5d  decode %7.1f us -> %6.1f us' %
+                  (units, extra, len(full), len(trimmed),
+                   decode_time(full, iterations), decode_time(trimmed, iterations)))
@@ -0,0 +1,90 @@
+# Memory and time used to process the hourly forecast.
+#
+# The recorded hourly forecast, trimmed to the fields the controller
+# asks for, is cut to 24, 48 and 72 periods and run through the hourly
+# ETo calculation two ways:
+#
+#   streamed - the body read a chunk at a time as the periods are
+#              decoded (what the controller does)
+#   decoded  - the whole response decoded first, then the periods used
+#
+# The time taken, the memory held by the response before its periods
+# are used and the peak memory allocated while processing it are
+# reported.  The body is handed out in chunks as the HTTP client reads
+# it, without counting the body itself.  The streamed memory should
+# stay about the same however many periods there are.
+#
+# usage: python3 -m benchmarks.bench_hourly [iterations]
+
+import sys
+import time
+import copy
+import tracemalloc
+
+import benchmarks
+from benchmarks import payloads
+from nodes import decode
+from nodes import http_client
+from nodes import hourly
+from nodes import uom
+
+PROFILE = uom.PROFILES['metric']
+HOURLY = payloads.project(payloads.load('hourly'), PROFILE.fields['hourly'])
+
+def body(periods):
+    payload = copy.deepcopy(HOURLY)
+    for response in payload['response']:
+        response['periods'] = response['periods'][:periods]
+    return payloads.encode(payload)
+
+def run_eto(periods):
+    eto = hourly.HourlyEto(47.606, -122.332, 56.0, 0.23, PROFILE)
+    for period in periods:
+        eto.add(period)
+    return eto.days()
+
+# The body's chunks, as the HTTP client hands them out
+def chunks(data):
+    for i in range(0, len(data), http_client.CHUNK_SIZE):
+        yield data[i:i + http_client.CHUNK_SIZE]
+
+# How each method turns the response body in to the object that's
+# returned and how the periods are then processed
+METHODS = [
+    ('streamed', lambda data: decode.StreamedResponse(chunks(data)), lambda response: run_eto(response.periods())),
+    ('decoded', decode.loads, lambda response: run_eto(response['response'][0]['periods'])),
+]
+
+# Return (median seconds, bytes held by the response object, peak
+# bytes allocated while processing it)
+def measure(prepare, process, data, iterations):
+    times = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        process(prepare(data))
+        times.append(time.perf_counter() - start)
+    times.sort()
+
+    tracemalloc.start()
+    response = prepare(data)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    process(response)
+    peak = tracemalloc.get_traced_memory()[1] - held
+    tracemalloc.stop()
+    return (times[len(times) // 2], held, peak)
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    print('%-8s %8s %8s %10s %9s %9s' % ('method', 'periods', 'bytes', 'median us', 'held KiB', 'peak KiB'))
+    for count in [24, 48, 72]:
+        data = body(count)
+        results = []
+        for (name, prepare, process) in METHODS:
+            results.append(process(prepare(data)))
+            (median, held, peak) = measure(prepare, process, data, iterations)
+            print('%-8s %8d %8d %10.1f %9.1f %9.1f' % (name, count, len(data), median * 1e6, held / 1024.0, peak / 1024.0))
+        if results[0] != results[1]:
+            print('streamed and decoded ETo differ')
+            sys.exit(1)
@@ -0,0 +1,257 @@
+# End to end timing of the poll pipeline.
+#
+# Runs the controller against the mock polyinterface layer and the
+# recorded AERIS fixtures and times each stage on its own:
+#
+#   query_conditions      - a shortPoll cycle
+#   query_forecast_<N>d   - a longPoll cycle with N forecast days
+#   query_forecast_hourly - a 3 day longPoll cycle with Hourly ETo on
+#   query_forecast_rollover - a 6 day longPoll cycle after midnight
+#   update_forecast       - processing one forecast period
+#   evapotranspiration    - the ETo calculation for one day
+#   evapotranspiration_table - the same using a location's SolarTable
+#
+# By default the responses are handed straight to the controller so
+# only the node server's own work is measured.  With --server they
+# are fetched over HTTP from the fake AERIS server instead.
+#
+# The results are written as JSON.  Give --compare an earlier results
+# file to see how each timing has changed.
+#
+# usage: python3 -m benchmarks.bench_poll [--iterations N] [--output FILE]
+#                                         [--compare FILE] [--server]
+
+import copy
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import urllib.parse
+
+from benchmarks import mock_poly
+mock_poly.install()
+
+from benchmarks import payloads
+from benchmarks import fake_aeris
+from nodes import aeris
+from nodes import decode
+from nodes import et3
+from nodes import http_client
+
+# Hands out the fixture responses without going over the network
+class CannedHttp:
+    def __init__(self, fixtures):
+        self.fixtures = fixtures
+        self.bodies = {}
+        self.pool_size = http_client.DEFAULT_POOL_SIZE
+
+    def set_pool_size(self, pool_size):
+        self.pool_size = int(pool_size)
+
+    def set_timeouts(self, connect, read):
+        pass
+
+    def get(self, url, deadline=None):
+        body = self.bodies.get(url)
+        if body is None:
+            body = json.dumps(self.fixtures.answer(urllib.parse.urlsplit(url))).encode('utf-8')
+            self.bodies[url] = body
+        return http_client.HttpResponse(200, {}, body)
+
+    def stream(self, url, deadline=None):
+        body = self.get(url, deadline).body
+        chunks = [body[i:i + http_client.CHUNK_SIZE] for i in range(0, len(body), http_client.CHUNK_SIZE)]
+        return http_client.HttpResponse(200, {}, chunks)
+
+    def close(self):
+        pass
+
+def make_controller(days, server=None, params={}):
+    poly = mock_poly.Interface(dict({
+        'ClientID': 'benchmark',
+        'ClientSecret': 'benchmark',
+        'Location': 'seattle,wa',
+        'Forecast Days': str(days),
+        }, **params))
+    controller = aeris.Controller(poly)
+    if server is None:
+        controller.http = CannedHttp(fake_aeris.Fixtures())
+    else:
+        controller.api_url = server.url
+    controller.start()
+    return controller
+
+# Get the controller ready to do a full update again, with every
+# driver sent as if it had changed.
+def reset(controller):
+    controller.scheduler.next_due.clear()
+    controller.refresher.reset()
+    controller.observer.reset()
+    controller.cache.invalidate()
+    controller.reset_tracking()
+    controller.clear_driver_calls()
+    for node in controller.all_nodes():
+        node.reported = {}
+
+# Call run() iterations times, returning the time each call took and
+# the number of setDriver calls each made.
+def measure(run, iterations, warmup, prepare=None, controller=None):
+    times = []
+    calls = []
+    for i in range(warmup + iterations):
+        if prepare is not None:
+            prepare()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            times.append(elapsed)
+            if controller is not None:
+                calls.append(controller.count_driver_calls())
+    return summarize(times, calls)
+
+def summarize(times, calls):
+    times = sorted(t * 1000000 for t in times)
+    result = {
+        'iterations': len(times),
+        'mean_us': statistics.mean(times),
+        'median_us': statistics.median(times),
+        'p95_us': times[max(0, int(len(times) * 0.95) - 1)],
+        'min_us': times[0],
+        'max_us': times[-1],
+        'stdev_us': statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+    if len(calls) > 0:
+        result['set_driver_calls'] = statistics.mean(calls)
+    return result
+
+def bench_conditions(iterations, warmup, server):
+    controller = make_controller(6, server)
+    return measure(controller.query_conditions, iterations, warmup, lambda: reset(controller), controller)
+
+def bench_forecast(days, iterations, warmup, server, params={}):
+    controller = make_controller(days, server, params)
+    return measure(controller.query_forecast, iterations, warmup, lambda: reset(controller), controller)
+
+# A longPoll cycle just after midnight, when all but the last forecast
+# day were already shown on the next node.
+def bench_rollover(iterations, warmup):
+    controller = make_controller(6)
+    base = controller.http.fixtures.responses['forecasts']
+    shifted = {}
+
+    # Make the canned forecast start days days later, as if that many
+    # midnights had passed.  Each one keeps its own encoded responses
+    # so they aren't encoded again every time.
+    def shift(days):
+        if days not in shifted:
+            payload = copy.deepcopy(base)
+            for response in payload['response']:
+                response['periods'] = response['periods'][days:]
+            shifted[days] = (payload, {})
+        (payload, bodies) = shifted[days]
+        controller.http.fixtures.responses['forecasts'] = payload
+        controller.http.bodies = bodies
+
+    def prepare():
+        shift(0)
+        reset(controller)
+        controller.query_forecast()
+        shift(1)
+        controller.scheduler.next_due.clear()
+        controller.refresher.reset()
+        controller.cache.invalidate()
+        controller.clear_driver_calls()
+
+    return measure(controller.query_forecast, iterations, warmup, prepare, controller)
+
+def bench_update_forecast(iterations, warmup):
+    controller = make_controller(1)
+    node = controller.nodes['forecast_0']
+    forecast = payloads.FORECASTS['response'][0]['periods'][0]
+    solar = et3.SolarTable(47.606, 56.0)
+    run = lambda: node.update_forecast(forecast, 47.606, '56', '0.23', controller.tag, True, controller.extractors['forecasts'], solar)
+    return measure(run, iterations, warmup, controller.clear_driver_calls, controller)
+
+def bench_evapotranspiration(iterations, warmup):
+    run = lambda: et3.evapotranspriation(27.3, 10.7, None, 1.3, 401.33, 91, 36, 36.82, 0.23, 289)
+    return measure(run, iterations, warmup)
+
+def bench_evapotranspiration_table(iterations, warmup):
+    solar = et3.SolarTable(36.82, 401.33)
+    run = lambda: et3.evapotranspriation(27.3, 10.7, None, 1.3, 401.33, 91, 36, 36.82, 0.23, 289, solar)
+    return measure(run, iterations, warmup)
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def run(iterations, warmup, use_server):
+    server = None
+    if use_server:
+        server = fake_aeris.FakeAeris().start()
+
+    results = {}
+    results['query_conditions'] = bench_conditions(iterations, warmup, server)
+    for days in range(1, 7):
+        results['query_forecast_%dd' % days] = bench_forecast(days, iterations, warmup, server)
+    results['query_forecast_hourly'] = bench_forecast(3, iterations, warmup, server, {'Hourly ETo': 'on'})
+    results['query_forecast_rollover'] = bench_rollover(iterations, warmup)
+    results['update_forecast'] = bench_update_forecast(iterations, warmup)
+    results['evapotranspiration'] = bench_evapotranspiration(iterations * 10, warmup)
+    results['evapotranspiration_table'] = bench_evapotranspiration_table(iterations * 10, warmup)
+
+    if server is not None:
+        server.stop()
+
+    return {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'decoder': decode.decoder_name,
+        'transport': 'server' if use_server else 'canned',
+        'results': results,
+    }
+
+def report(data):
+    print('%-24s %10s %10s %10s %8s' % ('benchmark', 'median us', 'p95 us', 'max us', 'drivers'))
+    for name in data['results']:
+        r = data['results'][name]
+        print('%-24s %10.1f %10.1f %10.1f %8s' % (name, r['median_us'], r['p95_us'], r['max_us'],
+              '%.0f' % r['set_driver_calls'] if 'set_driver_calls' in r else '-'))
+
+def compare(old, new):
+    print('')
+    print('compared to %s (%s)' % (old.get('revision'), old.get('timestamp')))
+    for name in new['results']:
+        if name not in old['results']:
+            continue
+        before = old['results'][name]['median_us']
+        after = new['results'][name]['median_us']
+        print('%-24s %10.1f -> %10.1f us  %+6.1f%%' % (name, before, after, (after - before) / before * 100))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='bench_poll', description='Time the poll pipeline')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='earlier results file to compare with')
+    parser.add_argument('--server', action='store_true', help='fetch from the fake AERIS server over HTTP')
+    args = parser.parse_args()
+
+    data = run(args.iterations, args.warmup, args.server)
+    report(data)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), data)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.write('\n')
@@ -0,0 +1,57 @@
+# Compare per-poll latency with and without connection pooling.
+#
+# Starts the fake AERIS server, which answers the observations and
+# observations/summary queries with the recorded fixtures, then runs
+# a number of simulated short polls (two requests each) using a fresh
+# connection per request (requests.get) and using the pooled
+# HttpClient.
+#
+# usage: python3 -m benchmarks.bench_pool [polls] [pool size]
+
+import sys
+import json
+import time
+import statistics
+
+import benchmarks
+import requests
+from benchmarks import fake_aeris
+from nodes import http_client
+
+def unpooled_get(url):
+    return requests.get(url).content
+
+def pooled_get(client):
+    return lambda url: client.get(url).body
+
+def run_polls(get, base, polls):
+    times = []
+    for i in range(polls):
+        start = time.perf_counter()
+        for extra in ('observations', 'observations/summary'):
+            json.loads(get(base + extra + '/seattle,wa?client_id=x&client_secret=y'))
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+def report(label, times):
+    times = sorted(times)
+    p95 = times[int(len(times) * 0.95) - 1]
+    print('%-12s mean %7.3f ms  median %7.3f ms  p95 %7.3f ms' %
+          (label, statistics.mean(times), statistics.median(times), p95))
+
+if __name__ == '__main__':
+    polls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    pool_size = int(sys.argv[2]) if len(sys.argv) > 2 else http_client.DEFAULT_POOL_SIZE
+
+    server = fake_aeris.FakeAeris().start()
+    # Use a host name so that the unpooled case pays for name resolution
+    # the same way it does against api.aerisapi.com.
+    base = 'http://localhost:%d/' % server.server_address[1]
+
+    client = http_client.HttpClient(pool_size)
+
+    report('no pool', run_polls(unpooled_get, base, polls))
+    report('pooled', run_polls(pooled_get(client), base, polls))
+
+    client.close()
+    server.shutdown()
@@ -0,0 +1,151 @@
+# Simulate a week of polls to compare forecast and observation refresh
+# strategies.
+#
+# AERIS is made to reissue the forecast every few hours, a little late
+# or early each time, for a location 7 hours behind UTC.  Each
+# strategy is run against it with the long poll firing on its interval
+# and the report shows how many forecast queries it made and how long
+# it took to pick up each new issue and each midnight:
+#
+#   every_poll - query on every long poll
+#   cached     - every long poll, but through the 3 hour response cache
+#   adaptive   - the ForecastRefresher
+#
+# Then stations reporting every 5, 20 and 60 minutes, each report
+# showing up on AERIS 1 to 3 minutes after its timestamp, are polled
+# on every short poll and with the ObservationRefresher.  Reports
+# that were replaced before a poll saw them are counted as missed.
+#
+# usage: python3 -m benchmarks.bench_refresh [--days N] [--long-poll S]
+#                                            [--issue-interval S]
+#                                            [--jitter S] [--short-poll S]
+
+import random
+import argparse
+import statistics
+
+import benchmarks
+from nodes import cache
+from nodes import refresh
+
+START = 1602918000        # 2020-10-17 00:00 in Seattle
+UTC_OFFSET = -7 * 3600
+FORECAST_DAYS = 6
+
+# Times AERIS issues a new forecast
+def make_issues(days, interval, jitter, seed=1):
+    rng = random.Random(seed)
+    issues = []
+    t = START + 3 * 3600 + 1800
+    while t < START + days * 86400:
+        issues.append(t + rng.uniform(-jitter, jitter))
+        t += interval
+    return issues
+
+# The forecast as seen at time now: the timestamp of each day's period
+# and a hash that changes whenever a new forecast is issued.
+def forecast(now, issues):
+    issue = len([i for i in issues if i <= now])
+    today = START + int((now - START) // 86400) * 86400
+    timestamps = [today + d * 86400 for d in range(FORECAST_DAYS)]
+    return (timestamps, [hash((issue, ts)) for ts in timestamps])
+
+def simulate(strategy, days, long_poll, issues):
+    refresher = refresh.ForecastRefresher(long_poll)
+    cache_ttl = cache.DEFAULT_TTL['forecasts']
+    cached_until = 0
+    fetches = []
+
+    now = START + 420
+    end = START + days * 86400
+    while now < end:
+        fetch = True
+        if strategy == 'cached':
+            fetch = now >= cached_until
+        elif strategy == 'adaptive':
+            fetch = refresher.due(now)
+
+        if fetch:
+            fetches.append(now)
+            cached_until = now + cache_ttl
+            (timestamps, hashes) = forecast(now, issues)
+            refresher.record('seattle,wa', timestamps, hashes, now)
+        now += long_poll
+
+    return fetches
+
+# Seconds from each event until the first fetch after it
+def lags(events, fetches):
+    result = []
+    for event in events:
+        after = [f for f in fetches if f >= event]
+        if len(after) > 0:
+            result.append(after[0] - event)
+    return result
+
+# (timestamp, time it shows up on AERIS) of each station report
+def make_reports(days, cadence, seed=1):
+    rng = random.Random(seed)
+    reports = []
+    t = START + rng.uniform(0, cadence)
+    while t < START + days * 86400:
+        reports.append((int(t), t + rng.uniform(60, 180)))
+        t += cadence + rng.uniform(-10, 10)
+    return reports
+
+def simulate_observations(strategy, days, short_poll, reports):
+    refresher = refresh.ObservationRefresher(short_poll)
+    fetches = []
+    seen = {}
+
+    now = START + 420
+    end = START + days * 86400
+    r = 0
+    while now < end:
+        if strategy == 'every_poll' or refresher.due(now):
+            fetches.append(now)
+            while r + 1 < len(reports) and reports[r + 1][1] <= now:
+                r += 1
+            if reports[r][1] <= now:
+                seen.setdefault(reports[r][0], now)
+                refresher.record('station', reports[r][0], now)
+            else:
+                refresher.record('station', None, now)
+        now += short_poll
+
+    lag = [seen[ts] - available for (ts, available) in reports if ts in seen]
+    return (fetches, lag, len(reports) - len(seen))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='bench_refresh', description='Compare forecast refresh strategies')
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--long-poll', type=int, default=900)
+    parser.add_argument('--issue-interval', type=int, default=6 * 3600)
+    parser.add_argument('--jitter', type=int, default=600)
+    parser.add_argument('--short-poll', type=int, default=200)
+    args = parser.parse_args()
+
+    issues = make_issues(args.days, args.issue_interval, args.jitter)
+    midnights = [START + d * 86400 for d in range(1, args.days)]
+
+    print('%d days, long poll %d s, issued every %.1f h +/- %d s' %
+          (args.days, args.long_poll, args.issue_interval / 3600.0, args.jitter))
+    print('%-12s %10s %14s %14s %14s' % ('strategy', 'queries/day', 'issue lag avg', 'issue lag max', 'midnight max'))
+    for strategy in ['every_poll', 'cached', 'adaptive']:
+        fetches = simulate(strategy, args.days, args.long_poll, issues)
+        issue_lags = lags(issues, fetches)
+        midnight_lags = lags(midnights, fetches)
+        print('%-12s %10.1f %12.0f s %12.0f s %12.0f s' %
+              (strategy, len(fetches) / float(args.days), statistics.mean(issue_lags),
+               max(issue_lags), max(midnight_lags)))
+
+    print('')
+    print('short poll %d s, reports show up 60 - 180 s after their timestamp' % args.short_poll)
+    print('%-8s %-12s %11s %10s %10s %8s' % ('station', 'strategy', 'queries/day', 'lag avg', 'lag max', 'missed'))
+    for cadence in [300, 1200, 3600]:
+        reports = make_reports(args.days, cadence)
+        for strategy in ['every_poll', 'adaptive']:
+            (fetches, lag, missed) = simulate_observations(strategy, args.days, args.short_poll, reports)
+            print('%-8s %-12s %11.1f %8.0f s %8.0f s %8d' %
+                  ('%d min' % (cadence // 60), strategy, len(fetches) / float(args.days),
+                   statistics.mean(lag), max(lag), missed))
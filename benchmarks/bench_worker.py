@@ -0,0 +1,70 @@
+# Time how long the poll callbacks hold up Polyglot's thread.
+#
+# Starts the fake AERIS server with a slow response time and calls
+# shortPoll and longPoll every interval seconds, first with the polls
+# done on the calling thread and then with the background fetch
+# worker.  Reports how long each callback took to return, how many
+# requests reached the server and how many polls were dropped because
+# one was already waiting.
+#
+# usage: python3 -m benchmarks.bench_worker [--polls N] [--interval S]
+#                                           [--latency S]
+
+import time
+import argparse
+import statistics
+
+from benchmarks import mock_poly
+mock_poly.install()
+
+from benchmarks import fake_aeris
+from nodes import aeris
+
+def make_controller(server):
+    poly = mock_poly.Interface({
+        'ClientID': 'benchmark',
+        'ClientSecret': 'benchmark',
+        'Location': 'seattle,wa',
+        'Forecast Days': '3',
+        'Observation Refresh': 'fixed',
+        'Forecast Refresh': 'fixed',
+        })
+    controller = aeris.Controller(poly)
+    controller.api_url = server.url
+    return controller
+
+def run(server, polls, interval, background):
+    controller = make_controller(server)
+    controller.start()
+    if not background:
+        controller.worker.stop()
+    server.reset_counts()
+
+    times = []
+    for i in range(polls):
+        # Every poll is due, as if the poll intervals were this short
+        controller.scheduler.next_due.clear()
+        controller.cache.invalidate()
+        start = time.perf_counter()
+        controller.shortPoll()
+        controller.longPoll()
+        times.append(time.perf_counter() - start)
+        time.sleep(interval)
+
+    controller.stop()
+    return (times, server.requests, controller.metrics.counter('jobs_coalesced'))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='bench_worker', description='Time the poll callbacks')
+    parser.add_argument('--polls', type=int, default=20)
+    parser.add_argument('--interval', type=float, default=0.1)
+    parser.add_argument('--latency', type=float, default=0.25)
+    args = parser.parse_args()
+
+    with fake_aeris.FakeAeris(latency=args.latency) as server:
+        print('%d polls every %.2f s, AERIS responding in %.2f s' % (args.polls, args.interval, args.latency))
+        print('%-12s %12s %12s %10s %10s' % ('polls', 'median ms', 'max ms', 'requests', 'dropped'))
+        for (label, background) in [('inline', False), ('background', True)]:
+            (times, requests, dropped) = run(server, args.polls, args.interval, background)
+            print('%-12s %12.2f %12.2f %10d %10d' % (label, statistics.median(times) * 1000,
+                  max(times) * 1000, requests, dropped))
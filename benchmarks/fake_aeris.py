@@ -0,0 +1,301 @@
+# Offline stand-in for the AERIS API server.
+#
+# Serves the recorded observations, observations/summary, forecasts and
+# hourly forecasts (filter=1hr) fixtures (and batch requests of them)
+# over HTTP so the node server
+# can be exercised without api.aerisapi.com.  The fields= and limit=
+# query parameters are applied the same way the real server does.
+#
+# Faults can be injected to see how the node server copes:
+#   latency       - seconds to wait before answering each request
+#   jitter        - random extra latency, up to this many seconds
+#   error_rate    - fraction of requests answered with error_status
+#   truncate_rate - fraction of responses cut off part way through
+#
+# Record mode queries the real AERIS API and saves the full responses
+# as the fixtures.
+#
+# usage: python3 -m benchmarks.fake_aeris serve [--port N] [--latency S] ...
+#        python3 -m benchmarks.fake_aeris record --client-id ID --client-secret SECRET --location LOC
+
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import benchmarks
+import requests
+from benchmarks import payloads
+
+ENDPOINTS = list(payloads.FIXTURE_NAMES.keys())
+
+# Error returned by AERIS for requests without valid credentials
+INVALID_CLIENT = {
+    'success': False,
+    'error': {'code': 'invalid_client', 'description': 'The client provided is invalid.'},
+    'response': [],
+}
+
+class Fixtures:
+    def __init__(self, directory=payloads.FIXTURES):
+        self.directory = directory
+        self.responses = {}
+        for endpoint in ENDPOINTS:
+            self.responses[endpoint] = payloads.load(endpoint, directory)
+
+    # Split a request path in to (endpoint, location)
+    def route(self, path):
+        # Check the longest endpoint names first so observations/summary
+        # isn't taken for observations.
+        for endpoint in sorted(ENDPOINTS, key=len, reverse=True):
+            prefix = '/' + endpoint + '/'
+            if path.startswith(prefix):
+                return (endpoint, urllib.parse.unquote(path[len(prefix):]))
+        return (None, None)
+
+    # Build the response to a single (non batch) request
+    def respond(self, path, query):
+        (endpoint, location) = self.route(path)
+        if endpoint is None:
+            return (endpoint, {
+                'success': False,
+                'error': {'code': 'invalid_request', 'description': 'Unknown endpoint ' + path},
+                'response': [],
+            })
+
+        if endpoint == 'forecasts' and query.get('filter') == ['1hr']:
+            endpoint = 'hourly'
+
+        payload = copy.deepcopy(self.responses[endpoint])
+
+        if 'limit' in query and isinstance(payload['response'], list):
+            limit = int(query['limit'][0])
+            for response in payload['response']:
+                if 'periods' in response:
+                    response['periods'] = response['periods'][:limit]
+
+        if 'fields' in query:
+            payload = payloads.project(payload, query['fields'][0])
+
+        return (endpoint, payload)
+
+    # The requests parameter is a comma separated list of encoded
+    # requests, split it before decoding them.
+    def batch_requests(self, url):
+        raw = ''
+        for param in url.query.split('&'):
+            if param.startswith('requests='):
+                raw = param[len('requests='):]
+        return [urllib.parse.unquote(sub) for sub in raw.split(',')]
+
+    # The endpoints a request queries
+    def endpoints(self, url):
+        if url.path.startswith('/batch'):
+            return [self.route(sub.partition('?')[0])[0] for sub in self.batch_requests(url)]
+        return [self.route(url.path)[0]]
+
+    # Build the response to a request, url is the urlsplit() request
+    def answer(self, url):
+        if not url.path.startswith('/batch'):
+            return self.respond(url.path, urllib.parse.parse_qs(url.query, keep_blank_values=True))[1]
+
+        responses = []
+        for sub in self.batch_requests(url):
+            (path, _, sub_query) = sub.partition('?')
+            (endpoint, payload) = self.respond(path, urllib.parse.parse_qs(sub_query, keep_blank_values=True))
+            payload['request'] = sub
+            responses.append(payload)
+
+        return {'success': True, 'error': None, 'response': {'responses': responses}}
+
+class FakeAerisHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+
+        server.count_request()
+        server.delay()
+
+        status = server.pick_error()
+        if status is not None:
+            self.send_body(status, json.dumps({'error': 'injected failure'}).encode('utf-8'))
+            return
+
+        if 'client_id' not in query or 'client_secret' not in query:
+            self.send_body(200, json.dumps(INVALID_CLIENT).encode('utf-8'))
+            return
+
+        for endpoint in server.fixtures.endpoints(url):
+            server.count_access(endpoint)
+
+        # The same request always gets the same answer, so only build
+        # it once to keep the server's own overhead out of the timings.
+        body = server.bodies.get(self.path)
+        if body is None:
+            body = json.dumps(server.fixtures.answer(url)).encode('utf-8')
+            server.bodies[self.path] = body
+
+        self.send_body(200, body, server.pick_truncate())
+
+    def send_body(self, status, body, truncate=False):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if truncate:
+            # Claim the full length but hang up half way through
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeAeris(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, fixtures=None, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, truncate_rate=0.0, seed=None):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', port), FakeAerisHandler)
+        self.fixtures = fixtures if fixtures is not None else Fixtures()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.truncate_rate = truncate_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.bodies = {}
+        self.thread = None
+        self.reset_counts()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    # requests is the number of HTTP requests, accesses the number of
+    # endpoint queries answered by endpoint (a batch request has
+    # several).
+    def reset_counts(self):
+        with self.lock:
+            self.requests = 0
+            self.accesses = dict.fromkeys(ENDPOINTS, 0)
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def count_access(self, endpoint):
+        with self.lock:
+            if endpoint in self.accesses:
+                self.accesses[endpoint] += 1
+
+    def delay(self):
+        with self.lock:
+            seconds = self.latency + self.random.uniform(0, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def pick_error(self):
+        with self.lock:
+            if self.error_rate > 0 and self.random.random() < self.error_rate:
+                return self.error_status
+        return None
+
+    def pick_truncate(self):
+        with self.lock:
+            return self.truncate_rate > 0 and self.random.random() < self.truncate_rate
+
+# Query the real AERIS API and save the full responses as fixtures.
+# The responses aren't limited to any fields so any fields= list can
+# be served from them.
+def record(client_id, client_secret, location, directory=payloads.FIXTURES, days=7):
+    auth = '?client_id=' + client_id + '&client_secret=' + client_secret
+    extras = {
+        'observations': '',
+        'observations/summary': '',
+        'forecasts': '&filter=mdnt2mdnt&precise&limit=' + str(days),
+        'hourly': '&filter=1hr&from=today&limit=72',
+    }
+    paths = {
+        'hourly': 'forecasts',
+    }
+
+    for endpoint in ENDPOINTS:
+        request = 'http://api.aerisapi.com/' + paths.get(endpoint, endpoint) + '/' + location + auth + extras[endpoint]
+        c = requests.get(request)
+        c.raise_for_status()
+        jdata = c.json()
+        if not jdata.get('success', False):
+            raise IOError('%s query failed: %s' % (endpoint, str(jdata.get('error'))))
+
+        filename = directory + '/' + payloads.FIXTURE_NAMES[endpoint] + '.json'
+        with open(filename, 'w') as f:
+            json.dump(jdata, f, indent=2)
+            f.write('\n')
+        print('Recorded %s (%d bytes) to %s' % (endpoint, len(c.content), filename))
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='fake_aeris', description='Offline stand-in for the AERIS API')
+    commands = parser.add_subparsers(dest='command')
+
+    serve = commands.add_parser('serve', help='serve the recorded fixtures')
+    serve.add_argument('--port', type=int, default=8080)
+    serve.add_argument('--fixtures', default=payloads.FIXTURES)
+    serve.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    serve.add_argument('--jitter', type=float, default=0.0, help='random extra latency, in seconds')
+    serve.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail')
+    serve.add_argument('--error-status', type=int, default=503)
+    serve.add_argument('--truncate-rate', type=float, default=0.0, help='fraction of responses cut short')
+    serve.add_argument('--seed', type=int, default=None)
+
+    rec = commands.add_parser('record', help='record fixtures from the AERIS API')
+    rec.add_argument('--client-id', required=True)
+    rec.add_argument('--client-secret', required=True)
+    rec.add_argument('--location', required=True)
+    rec.add_argument('--days', type=int, default=7)
+    rec.add_argument('--fixtures', default=payloads.FIXTURES)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        record(args.client_id, args.client_secret, args.location, args.fixtures, args.days)
+    elif args.command == 'serve':
+        server = FakeAeris(args.port, Fixtures(args.fixtures), args.latency, args.jitter,
+                           args.error_rate, args.error_status, args.truncate_rate, args.seed)
+        print('Serving AERIS fixtures from %s on %s' % (args.fixtures, server.url))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
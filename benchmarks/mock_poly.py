@@ -0,0 +1,131 @@
+# Mock polyinterface layer for running the node server outside of
+# Polyglot.
+#
+# Provides just enough of the polyinterface Node, Controller and
+# Interface classes for the nodes to be created, started and polled.
+# Every setDriver call is recorded so the benchmarks can report how
+# many driver updates a poll sends.
+#
+# install() must be called before any of the nodes modules are
+# imported so they subclass these classes.
+
+import sys
+import copy
+import types
+import logging
+
+LOGGER = logging.getLogger('mock_poly')
+
+class Node:
+    drivers = []
+
+    def __init__(self, controller, primary, address, name):
+        self.controller = controller
+        self.parent = controller
+        self.primary = primary
+        self.address = address
+        self.name = name
+        self.poly = getattr(controller, 'poly', None)
+        self.drivers = copy.deepcopy(self.drivers)
+        self.driver_calls = []
+
+    def setDriver(self, driver, value, report=True, force=False, uom=None):
+        self.driver_calls.append((driver, value, uom))
+        for d in self.drivers:
+            if d['driver'] == driver:
+                d['value'] = value
+                if uom is not None:
+                    d['uom'] = uom
+
+    def getDriver(self, driver):
+        for d in self.drivers:
+            if d['driver'] == driver:
+                return d['value']
+        return None
+
+    def reportDriver(self, driver, force=False):
+        pass
+
+    def reportDrivers(self):
+        pass
+
+    def start(self):
+        pass
+
+class Controller(Node):
+    def __init__(self, poly):
+        Node.__init__(self, self, 'controller', 'controller', 'Controller')
+        self.poly = poly
+        self.polyConfig = poly.polyConfig
+        self.nodes = {}
+        self.notices = {}
+
+    def addNode(self, node):
+        self.nodes[node.address] = node
+        node.start()
+        return node
+
+    def delNode(self, address):
+        self.nodes.pop(address, None)
+
+    def addNotice(self, data, key=None):
+        self.notices[key] = data
+
+    def removeNotice(self, key):
+        self.notices.pop(key, None)
+
+    def removeNoticesAll(self):
+        self.notices = {}
+
+    def addCustomParam(self, params):
+        self.poly.addCustomParam(params)
+
+    # Number of setDriver calls recorded across all the nodes
+    def count_driver_calls(self):
+        calls = len(self.driver_calls)
+        for address in self.nodes:
+            if self.nodes[address] is not self:
+                calls += len(self.nodes[address].driver_calls)
+        return calls
+
+    def clear_driver_calls(self):
+        self.driver_calls = []
+        for address in self.nodes:
+            self.nodes[address].driver_calls = []
+
+class Interface:
+    def __init__(self, params, short_poll=60, long_poll=300, level=logging.WARNING):
+        self.polyConfig = {
+                'customParams': dict(params),
+                'customData': {'level': level},
+                'shortPoll': short_poll,
+                'longPoll': long_poll,
+                }
+
+    def onConfig(self, callback):
+        pass
+
+    def addCustomParam(self, params):
+        self.polyConfig['customParams'].update(params)
+
+    def saveCustomData(self, data):
+        self.polyConfig['customData'] = data
+
+    def addNotice(self, data, key=None):
+        pass
+
+    def installprofile(self):
+        return True
+
+    def getNode(self, address):
+        return None
+
+# Make 'import polyinterface' return this module
+def install():
+    module = types.ModuleType('polyinterface')
+    module.LOGGER = LOGGER
+    module.Node = Node
+    module.Controller = Controller
+    module.Interface = Interface
+    sys.modules['polyinterface'] = module
+    return module
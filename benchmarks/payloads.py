@@ -0,0 +1,61 @@
+# Canned AERIS responses used by the benchmarks.
+#
+# The responses are loaded from the recorded fixtures in
+# benchmarks/fixtures, see fake_aeris.py for how to record new ones.
+
+import os
+import copy
+import json
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Fixture file name for each endpoint
+FIXTURE_NAMES = {
+    'observations': 'observations',
+    'observations/summary': 'observations_summary',
+    'forecasts': 'forecasts',
+    'hourly': 'forecasts_hourly',
+}
+
+def load(endpoint, directory=FIXTURES):
+    with open(os.path.join(directory, FIXTURE_NAMES[endpoint] + '.json')) as f:
+        return json.load(f)
+
+OBSERVATIONS = load('observations')
+SUMMARY = load('observations/summary')
+_FORECASTS = load('forecasts')
+
+# The recorded forecast limited to the first days periods
+def forecasts(days=6):
+    payload = copy.deepcopy(_FORECASTS)
+    for response in payload['response']:
+        response['periods'] = response['periods'][:days]
+    return payload
+
+FORECASTS = forecasts()
+
+def encode(payload):
+    return json.dumps(payload).encode('utf-8')
+
+# Apply an AERIS fields= list to a response the way the server does,
+# keeping only the named values.
+def project(payload, fields):
+    def select(obj, path, out):
+        if isinstance(obj, list):
+            if not isinstance(out, list) or len(out) != len(obj):
+                out = [{} for item in obj]
+            return [select(item, path, o) for (item, o) in zip(obj, out)]
+        if not isinstance(obj, dict) or path[0] not in obj:
+            return out
+        if len(path) == 1:
+            out[path[0]] = obj[path[0]]
+        else:
+            out[path[0]] = select(obj[path[0]], path[1:], out.get(path[0], {}))
+        return out
+
+    response = payload['response']
+    projected = [] if isinstance(response, list) else {}
+    for field in fields.split(','):
+        projected = select(response, field.split('.'), projected)
+
+    return {'success': payload['success'], 'error': payload['error'], 'response': projected}
@@ -26,17 +26,88 @@ def add_functions_as_methods(functions):
     return decorator
 
 
+# Driver changes no bigger than these aren't worth reporting.  The
+# controller can override them with the Deadbands parameter.
+DEADBANDS = {
+        'CLITEMP': 0.1,   # temperature
+        'DEWPT': 0.1,     # dew point
+        'GV2': 0.1,       # feels like
+        'GV3': 0.1,       # heat index
+        'GV4': 0.1,       # wind chill
+        'WINDDIR': 1,     # wind direction
+        }
+
 # Wrap all the setDriver calls so that we can check that the 
 # value exist first.
+#
+# While a driver batch is open the values are only collected, they're
+# sent when flush_drivers() is called.
 def update_driver(self, driver, value, force=False, prec=3):
     try:
         if value == None or value == "None":
             value = "0"
-        self.setDriver(driver, round(float(value), prec), True, force, self.uom[driver])
-        LOGGER.debug('setDriver (%s, %f)' %(driver, float(value)))
+        value = round(float(value), prec)
+        batch = getattr(self, 'driver_batch', None)
+        if batch is not None:
+            # Only the last value set during the batch is sent
+            if driver in batch:
+                force = force or batch[driver][1]
+            batch[driver] = (value, force)
+        else:
+            send_driver(self, driver, value, force)
     except:
         LOGGER.warning('Missing data for driver ' + driver)
 
+# Send a driver value unless it's within the driver's deadband of the
+# last value sent.
+def send_driver(self, driver, value, force=False):
+    uom = self.uom[driver]
+    if not hasattr(self, 'reported'):
+        self.reported = {}
+
+    if not force and driver in self.reported:
+        (last_value, last_uom) = self.reported[driver]
+        deadbands = getattr(self.controller, 'deadbands', DEADBANDS)
+        # allow for rounding error in the float values
+        if last_uom == uom and abs(value - last_value) <= deadbands.get(driver, 0) + 1e-9:
+            return False
+
+    self.setDriver(driver, value, True, force, uom)
+    self.reported[driver] = (value, uom)
+    LOGGER.debug('setDriver (%s, %f)' %(driver, value))
+    return True
+
+def start_driver_batch(self):
+    self.driver_batch = {}
+
+# Send the values collected since start_driver_batch()
+def flush_drivers(self):
+    batch = getattr(self, 'driver_batch', None)
+    self.driver_batch = None
+    if batch is None:
+        return
+
+    sent = 0
+    for driver in batch:
+        (value, force) = batch[driver]
+        try:
+            if send_driver(self, driver, value, force):
+                sent += 1
+        except:
+            LOGGER.warning('Failed to send driver ' + driver)
+    LOGGER.debug('%s: sent %d of %d driver updates' % (self.address, sent, len(batch)))
+
+# Parse a list of driver deadbands, DRIVER=value separated by commas.
+def parse_deadbands(value):
+    deadbands = {}
+    for entry in value.split(','):
+        entry = entry.strip()
+        if entry == '':
+            continue
+        (driver, _, band) = entry.partition('=')
+        deadbands[driver.strip().upper()] = abs(float(band))
+    return deadbands
+
 def get_saved_log_level(self):
     if 'customData' in self.polyConfig:
         if 'level' in self.polyConfig['customData']:
@@ -68,7 +139,7 @@ def set_logging_level(self, level=None):
     LOGGER.info('set_logging_level: Setting log level to %d' % level)
     LOGGER.setLevel(level)
 
-functions = (update_driver, get_saved_log_level, save_log_level, set_logging_level)
+functions = (update_driver, start_driver_batch, flush_drivers, get_saved_log_level, save_log_level, set_logging_level)
 
 """
     Functions to handle custom parameters.
@@ -11,18 +11,50 @@ except ImportError:
 import sys
 import time
 import datetime
-import requests
 import socket
 import math
 import re
 import json
+import logging
+import concurrent.futures
+import urllib.parse
 import node_funcs
+from nodes import aeris_conditions
 from nodes import aeris_daily
+from nodes import aeris_hourly
+from nodes import cache
+from nodes import decode
+from nodes import hourly
+from nodes import http_client
+from nodes import metrics
+from nodes import refresh
+from nodes import resilience
+from nodes import scheduler
+from nodes import site
 from nodes import uom
-from nodes import weather_codes as wx
+from nodes import worker
 
 LOGGER = polyinterface.LOGGER
 
+# AERIS API server.  Benchmarks point Controller.api_url at a local
+# stand-in server instead.
+API_URL = 'http://api.aerisapi.com'
+
+# Most requests to combine in one AERIS batch request
+MAX_BATCH = 25
+
+# The AERIS endpoint for the endpoints that aren't queried by name
+ENDPOINT_PATHS = {
+        'hourly': 'forecasts',
+        }
+
+# Endpoints whose periods are decoded as they're processed.  These are
+# never batched since a batch response is decoded all at once.
+STREAMED_ENDPOINTS = ['hourly']
+
+# Most days of hourly forecast periods to ask for
+HOURLY_DAYS = 3
+
 @node_funcs.add_functions_as_methods(node_funcs.functions)
 class Controller(polyinterface.Controller):
     id = 'weather'
@@ -34,10 +66,29 @@ class Controller(polyinterface.Controller):
         self.address = 'weather'
         self.primary = self.address
         self.configured = False
-        self.latitude = 0
         self.longitude = 0
         self.force = True
-        self.tag = {}
+        self.profile = uom.get_profile('imperial')
+        self.tag = self.profile.tags
+        self.fields = self.profile.fields
+        self.extractors = self.profile.extractors
+        self.api_url = API_URL
+        self.http = http_client.HttpClient()
+        self.executor = None
+        self.cache = cache.ResponseCache()
+        self.decode_stats = decode.DecodeStats()
+        self.backoff = resilience.Backoff()
+        self.breaker = resilience.CircuitBreaker()
+        self.last_good = {}
+        self.scheduler = scheduler.QuotaScheduler()
+        self.refresher = refresh.ForecastRefresher()
+        self.observer = refresh.ObservationRefresher()
+        self.metrics = metrics.Metrics()
+        self.worker = worker.FetchWorker(self.metrics)
+        self.deadbands = dict(node_funcs.DEADBANDS)
+        self.timeouts = 0
+        self.timed_out = False
+        self.sites = []
 
         self.params = node_funcs.NSParameters([{
             'name': 'ClientID',
@@ -81,6 +132,96 @@ class Controller(polyinterface.Controller):
             'isRequired': False,
             'notice': '',
             },
+            {
+            'name': 'Hourly ETo',
+            'default': 'off',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Hourly Nodes',
+            'default': '0',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Locations',
+            'default': '',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Observation Refresh',
+            'default': 'adaptive',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Forecast Refresh',
+            'default': 'adaptive',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Fetch Mode',
+            'default': 'batch',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Pool Size',
+            'default': '2',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Connect Timeout',
+            'default': '5',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Read Timeout',
+            'default': '15',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Poll Timeout',
+            'default': '30',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Daily Budget',
+            'default': '0',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Retries',
+            'default': '2',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Deadbands',
+            'default': '',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Metrics',
+            'default': 'off',
+            'isRequired': False,
+            'notice': '',
+            },
+            {
+            'name': 'Metrics File',
+            'default': '',
+            'isRequired': False,
+            'notice': '',
+            },
             ])
 
 
@@ -97,136 +238,636 @@ class Controller(polyinterface.Controller):
             LOGGER.debug('-- configuration is valid')
             self.removeNoticesAll()
             self.configured = True
-            if self.params.isSet('Forecast Days'):
-                self.discover()
+            self.worker.submit('configure', self.apply_config)
         elif valid:
             LOGGER.debug('-- configuration not changed, but is valid')
 
+    # Set everything up for the new configuration.  Runs on the worker
+    # so it doesn't change things in the middle of a poll.
+    def apply_config(self):
+        self.configure_http()
+        self.configure_sites()
+        self.configure_scheduler()
+        self.configure_metrics()
+        self.configure_deadbands()
+        self.set_units(self.params.get('Units'))
+        self.cache.invalidate()
+        if self.params.isSet('Forecast Days') or self.params.isSet('Locations') or self.params.isSet('Hourly Nodes'):
+            self.discover()
+        else:
+            # discover() does this for the nodes it makes
+            self.set_driver_uom(self.params.get('Units'))
+
     def start(self):
         LOGGER.info('Starting node server')
         self.check_params()
-        self.set_tags(self.params.get('Units'))
+        self.configure_http()
+        self.configure_sites()
+        self.configure_scheduler()
+        self.configure_metrics()
+        self.configure_deadbands()
+        self.set_units(self.params.get('Units'))
         self.discover()
+        LOGGER.info('Using %s to decode responses' % decode.decoder_name)
         LOGGER.info('Node server started')
 
         # Do an initial query to get filled in as soon as possible
-        self.query_conditions()
-        self.query_forecast()
+        self.update(['observations', 'observations/summary'] + self.forecast_endpoints())
         self.force = False
 
+        # From now on the polls are done in the background
+        self.worker.start()
+
+    # The polls only queue the work, the fetch worker does it
     def longPoll(self):
-        self.query_forecast()
+        self.worker.submit('query_forecast', self.query_forecast)
 
     def shortPoll(self):
-        self.query_conditions()
+        self.worker.submit('query_conditions', self.query_conditions)
 
-    # Query for the condition an forecast data
-    def get_weather_data(self, extra, lat=None, long=None):
-        request = 'http://api.aerisapi.com/' + extra + '/'
+    def configure_http(self):
+        self.http.set_pool_size(self.params.get('Pool Size'))
+        self.http.set_timeouts(self.params.get('Connect Timeout'), self.params.get('Read Timeout'))
 
-        request += self.params.get('Location')
-        request += '?client_id=' + self.params.get('ClientID')
-        request += '&client_secret=' + self.params.get('ClientSecret')
+        # The worker pool is sized to match the connection pool, so
+        # start a new one in case that changed.
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    # The controller's Location is the first site, followed by any
+    # extra locations.
+    def configure_sites(self):
+        primary = site.Site(self.name, self.params.get('Location'), self.params.get('Elevation'), self.params.get('Plant Type'), self.address, 'forecast_')
+
+        try:
+            extra = site.parse_locations(self.params.get('Locations'), self.params.get('Elevation'), self.params.get('Plant Type'))
+        except ValueError as e:
+            LOGGER.error('Invalid Locations parameter: ' + str(e))
+            self.addNotice('Invalid Locations parameter: ' + str(e), 'locations')
+            extra = []
+
+        # Only the observations give a site's latitude and longitude,
+        # keep them for the locations that haven't changed so the ETo
+        # isn't worked out for latitude 0 until the next short poll.
+        old = {}
+        for s in self.sites:
+            old[s.location] = s
+        for s in [primary] + extra:
+            if s.location in old:
+                s.latitude = old[s.location].latitude
+                s.longitude = old[s.location].longitude
+                s.solar = old[s.location].solar
+
+        self.sites = [primary] + extra
+        self.refresher.reset()
+        self.observer.reset()
+        LOGGER.info('Reporting weather data for %d locations' % len(self.sites))
+
+    def configure_scheduler(self):
+        self.scheduler.set_budget(self.params.get('Daily Budget'))
+        short_poll = self.polyConfig.get('shortPoll', 200)
+        long_poll = self.polyConfig.get('longPoll', 900)
+        cost = len(self.sites)
+        self.scheduler.set_interval('observations', short_poll, cost)
+        self.scheduler.set_interval('observations/summary', short_poll, cost)
+        self.scheduler.set_interval('forecasts', long_poll, cost)
+        if 'hourly' in self.forecast_endpoints():
+            self.scheduler.set_interval('hourly', long_poll, len(self.hourly_sites()))
+        else:
+            self.scheduler.remove('hourly')
+        self.refresher.set_interval(long_poll)
+        self.observer.set_interval(short_poll)
+
+    # The Deadbands parameter overrides the default driver deadbands
+    def configure_deadbands(self):
+        self.deadbands = dict(node_funcs.DEADBANDS)
+        try:
+            self.deadbands.update(node_funcs.parse_deadbands(self.params.get('Deadbands')))
+        except ValueError:
+            LOGGER.error('Invalid Deadbands parameter: ' + self.params.get('Deadbands'))
+            self.addNotice('Invalid Deadbands parameter, use DRIVER=value,DRIVER=value', 'deadbands')
+
+    def configure_metrics(self):
+        self.metrics.enable(self.params.get('Metrics').lower() == 'on')
+
+    # Update the poll time and error count drivers and write the
+    # metrics file after a poll.
+    def report_metrics(self, phase):
+        if not self.metrics.enabled:
+            return
+
+        last = self.metrics.last(phase)
+        if last is not None:
+            self.update_driver('GV24', last * 1000, prec=0)
+        self.update_driver('GV25', self.metrics.counter('errors'))
+
+        for name in self.metrics.phases():
+            (p50, p95, maximum) = self.metrics.summary(name)
+            LOGGER.debug('%s: p50 %.1f ms, p95 %.1f ms, max %.1f ms' % (name, p50 * 1000, p95 * 1000, maximum * 1000))
+        for endpoint in self.decode_stats.endpoints():
+            stats = self.decode_stats.get(endpoint)
+            LOGGER.debug('%s: %d responses, %d bytes, decoded in %.1f ms' % (endpoint, stats['count'], stats['bytes'], stats['time'] * 1000))
+
+        path = self.params.get('Metrics File')
+        if path != '':
+            try:
+                self.metrics.write(path, self.decode_stats)
+            except Exception as e:
+                LOGGER.error('Failed to write metrics file ' + path + ': ' + str(e))
+
+    # Time budget for all the requests made in one poll cycle
+    def poll_deadline(self):
+        try:
+            budget = float(self.params.get('Poll Timeout'))
+        except ValueError:
+            LOGGER.warning('Invalid Poll Timeout, using 30 seconds')
+            budget = 30.0
+        return http_client.Deadline(budget)
+
+    # Endpoint specific query parameters
+    def query_string(self, extra):
+        query = ''
 
         if extra == 'forecasts':
-            request += '&filter=mdnt2mdnt'
-            request += '&precise'
-            request += '&limit=' + self.params.get('Forecast Days')
+            query += '&filter=mdnt2mdnt'
+            query += '&precise'
+            query += '&limit=' + self.params.get('Forecast Days')
+        elif extra == 'hourly':
+            query += '&filter=1hr'
+            query += '&from=today'
+            query += '&limit=' + str(self.hourly_hours())
 
-        if extra == 'observations/summary':
-            request += '&fields=periods.summary.precip'
+        # Only ask for the fields we use
+        if extra in self.fields:
+            query += '&fields=' + self.fields[extra]
 
         #FIXME: add unit support if available
-        #request += '&units=' + self.units
+        #query += '&units=' + self.units
+
+        return query
+
+    def auth_string(self):
+        auth = '?client_id=' + self.params.get('ClientID')
+        auth += '&client_secret=' + self.params.get('ClientSecret')
+        return auth
+
+    # Query for the condition an forecast data
+    def get_weather_data(self, extra, lat=None, long=None, deadline=None, location=None):
+        request = self.api_url + '/' + ENDPOINT_PATHS.get(extra, extra) + '/'
+
+        if location is None:
+            location = self.params.get('Location')
+        request += location
+        request += self.auth_string()
+        request += self.query_string(extra)
+
+        return self.send_request(request, deadline, extra, 1)
+
+    # Query multiple endpoints with AERIS batch requests.  requests is
+    # a list of (site, endpoint) pairs.
+    #
+    # Returns a dictionary of the individual endpoint responses keyed
+    # by (site, endpoint) and the list of pairs whose batch request got
+    # no response at all.  Pairs whose batch response was bad are in
+    # neither.
+    def get_batch_data(self, requests, deadline=None):
+        results = {}
+        unanswered = []
+        for start in range(0, len(requests), MAX_BATCH):
+            batch = requests[start:start + MAX_BATCH]
+            (responses, answered) = self.get_batch(batch, deadline)
+            if responses != None:
+                results.update(zip(batch, responses))
+            elif not answered:
+                unanswered += batch
+
+        return (results, unanswered)
+
+    # Send one batch request.  Returns the list of responses, None if
+    # the batch failed, and whether AERIS answered the request.
+    def get_batch(self, requests, deadline):
+        sub_requests = []
+        for (s, extra) in requests:
+            sub = '/' + ENDPOINT_PATHS.get(extra, extra) + '/' + s.location
+            query = self.query_string(extra)
+            if query != '':
+                sub += '?' + query[1:]
+            # Each request's own query string has to be encoded so it
+            # isn't confused with the batch request parameters.
+            sub_requests.append(urllib.parse.quote(sub, safe='/=.'))
+
+        request = self.api_url + '/batch'
+        request += self.auth_string()
+        request += '&requests=' + ','.join(sub_requests)
+
+        jdata = self.send_request(request, deadline, 'batch', len(requests), [extra for (s, extra) in requests])
+        if jdata == None:
+            return (None, False)
+
+        try:
+            if not jdata['success']:
+                LOGGER.error('Batch request failed: ' + str(jdata['error']))
+                return (None, True)
+            responses = jdata['response']['responses']
+        except Exception as e:
+            LOGGER.error('Bad batch response: ' + str(e))
+            return (None, True)
+
+        if len(responses) != len(requests):
+            LOGGER.error('Batch response has %d responses, expected %d' % (len(responses), len(requests)))
+            return (None, True)
+
+        return (responses, True)
 
+    # Send a request, retrying failures after a backoff delay.  Returns
+    # the decoded response or None if the request failed.
+    #
+    # accesses is the number of API accesses the request counts as and
+    # parts the endpoint of each response in a batch request.
+    def send_request(self, request, deadline=None, endpoint='', accesses=1, parts=None):
         LOGGER.debug('request = %s' % request)
 
+        if not self.breaker.allow():
+            LOGGER.warning('AERIS service unavailable, skipping ' + endpoint + ' request')
+            return None
+
         try:
-            c = requests.get(request)
-            jdata = c.json()
-            c.close()
+            retries = int(self.params.get('Retries'))
+        except ValueError:
+            retries = 2
+
+        for attempt in range(0, retries + 1):
+            if attempt > 0:
+                delay = self.backoff.delay(attempt - 1)
+                if deadline is not None and delay >= deadline.remaining():
+                    LOGGER.warning('Not enough time left in poll to retry ' + endpoint + ' request')
+                    break
+                LOGGER.info('Retrying %s request in %.1f seconds' % (endpoint, delay))
+                time.sleep(delay)
+
+            try:
+                jdata = self.send_request_once(request, deadline, endpoint, accesses, parts)
+                self.breaker.record_success()
+                return jdata
+            except http_client.RequestTimeout as e:
+                # The poll's time is used up, or the server is too slow
+                # to be worth waiting on again.
+                LOGGER.error('HTTP request to api.aerisapi.com timed out: ' + str(e))
+                self.timed_out = True
+                break
+            except Exception as e:
+                LOGGER.error('HTTP request failed for api.aerisapi.com: ' + str(e))
+
+        self.metrics.count('errors')
+        self.breaker.record_failure()
+        if self.breaker.tripped():
+            LOGGER.warning('AERIS requests are failing, pausing queries')
+        return None
+
+    def send_request_once(self, request, deadline, endpoint, accesses, parts=None):
+        self.scheduler.count(accesses)
+        if endpoint in STREAMED_ENDPOINTS:
+            # Only the start of the body is read here, the rest is
+            # read as the periods are used.
+            with self.metrics.phase('http'):
+                c = self.http.stream(request, deadline)
+            if c.status >= 500 or c.status == 429:
+                c.body.close()
+                raise IOError('HTTP status %d' % c.status)
+            with self.metrics.phase('decode'):
+                return decode.stream(c.body, endpoint, self.decode_stats)
+
+        with self.metrics.phase('http'):
+            c = self.http.get(request, deadline)
+        if c.status >= 500 or c.status == 429:
+            raise IOError('HTTP status %d' % c.status)
+
+        start = time.perf_counter()
+        with self.metrics.phase('decode'):
+            jdata = decode.decode(c.body, endpoint, self.decode_stats, parts)
+
+        # Only build the payload dump if it's going to be logged
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug('%s: %d bytes, decoded in %.3f ms' % (endpoint, len(c.body), (time.perf_counter() - start) * 1000))
             LOGGER.debug(jdata)
-        except:
-            LOGGER.error('HTTP request failed for api.aerisapi.com')
-            jdata = None
 
         return jdata
 
-    def set_tags(self, units):
-        if units == 'metric':
-            self.tag['temperature'] = 'tempC'
-            self.tag['humidity'] = 'humidity'
-            self.tag['pressure'] = 'pressureMB'
-            self.tag['windspeed'] = 'windSpeedKPH'
-            self.tag['gustspeed'] = 'windGustKPH'
-            self.tag['winddir'] = 'windDirDEG'
-            self.tag['visibility'] = 'visibilityKM'
-            self.tag['precipitation'] = 'precipMM'
-            self.tag['snow'] = 'snowDepthCM'
-            self.tag['snowf'] = 'snowCM'
-            self.tag['dewpoint'] = 'dewpointC'
-            self.tag['heatindex'] = 'heatindexC'
-            self.tag['windchill'] = 'windchillC'
-            self.tag['feelslike'] = 'feelslikeC'
-            self.tag['solarrad'] = 'solradWM2'
-            self.tag['sky'] = 'sky'
-            self.tag['temp_min'] = 'minTempC'
-            self.tag['temp_max'] = 'maxTempC'
-            self.tag['humidity_min'] = 'minHumidity'
-            self.tag['humidity_max'] = 'maxHumidity'
-            self.tag['wind_min'] = 'windSpeedMinKPH'
-            self.tag['wind_max'] = 'windSpeedMaxKPH'
-            self.tag['winddir_min'] = 'windDirMinDEG'
-            self.tag['winddir_max'] = 'windDirMaxDEG'
-            self.tag['uv'] = 'uvi'
-            self.tag['pop'] = 'pop'
-            self.tag['timestamp'] = 'timestamp'
-            self.tag['precip_summary'] = 'totalMM'
+    def cache_key(self, s, extra):
+        return cache.ResponseCache.key(extra, s.location, self.query_string(extra))
+
+    # Look up the (site, endpoint) requests in the response cache and
+    # only fetch the ones that are missing or have expired.  Returns the
+    # results and the set of requests whose results weren't fetched
+    # this time, either from the cache or the last good data after a
+    # failed query.
+    def fetch_cached(self, requests, deadline=None, bypass_cache=False):
+        results = {}
+        stale = set()
+        missing = []
+        for (s, extra) in requests:
+            jdata = None
+            if not bypass_cache:
+                jdata = self.cache.get(self.cache_key(s, extra))
+            if jdata == None:
+                missing.append((s, extra))
+            else:
+                LOGGER.debug('Using cached ' + extra + ' data for ' + s.location)
+                results[(s, extra)] = jdata
+                stale.add((s, extra))
+
+        if len(missing) > 0:
+            fetched = self.fetch(missing, deadline)
+            for (s, extra) in fetched:
+                jdata = fetched[(s, extra)]
+                if jdata != None and jdata.get('success', False):
+                    # Streamed responses can only be read once
+                    if extra not in STREAMED_ENDPOINTS:
+                        self.cache.put(self.cache_key(s, extra), jdata)
+                        self.last_good[(s.location, extra)] = (time.time(), jdata)
+                elif (s.location, extra) in self.last_good:
+                    # Keep showing the last good data, the data age
+                    # driver shows how old it is.
+                    LOGGER.warning('Query for ' + extra + ' failed, using last good data')
+                    jdata = self.last_good[(s.location, extra)][1]
+                    stale.add((s, extra))
+                results[(s, extra)] = jdata
+
+        LOGGER.debug('Response cache hits = %d, misses = %d' % (self.cache.hits, self.cache.misses))
+        return (results, stale)
+
+    # Fetch the data for all the (site, endpoint) requests due this
+    # cycle.
+    #
+    # Fetch Mode controls how multiple requests are sent:
+    #   batch      - combine them into batch requests, falling back
+    #                to concurrent requests for any that fail.
+    #   concurrent - send individual requests at the same time.
+    #   sequential - send individual requests one after the other.
+    def fetch(self, requests, deadline=None):
+        mode = self.params.get('Fetch Mode').lower()
+        results = {}
+
+        batchable = [r for r in requests if r[1] not in STREAMED_ENDPOINTS]
+        if len(batchable) > 1 and mode == 'batch':
+            (batched, unanswered) = self.get_batch_data(batchable, deadline)
+            results.update(batched)
+            if len(unanswered) > 0:
+                # The batch request was already retried (or skipped
+                # by the circuit breaker), sending each endpoint on
+                # its own would only hit a server that isn't
+                # answering with more requests.
+                LOGGER.warning('AERIS did not answer the batch request, skipping the remaining queries')
+                for r in requests:
+                    if r not in results:
+                        results[r] = None
+                return results
+            requests = [r for r in requests if r not in results]
+            if len(requests) == 0:
+                return results
+            if len([r for r in requests if r in batchable]) > 0:
+                LOGGER.warning('Batch request failed, querying endpoints individually')
+
+        if len(requests) > 1 and mode != 'sequential':
+            results.update(self.fetch_concurrent(requests, deadline))
         else:
-            self.tag['temperature'] = 'tempF'
-            self.tag['humidity'] = 'humidity'
-            self.tag['pressure'] = 'pressureIN'
-            self.tag['windspeed'] = 'windSpeedMPH'
-            self.tag['gustspeed'] = 'windGustMPH'
-            self.tag['winddir'] = 'windDirDEG'
-            self.tag['visibility'] = 'visibilityMI'
-            self.tag['precipitation'] = 'precipIN'
-            self.tag['snow'] = 'snowDepthIN'
-            self.tag['snowf'] = 'snowIN'
-            self.tag['dewpoint'] = 'dewpointF'
-            self.tag['heatindex'] = 'heatindexF'
-            self.tag['windchill'] = 'windchillF'
-            self.tag['feelslike'] = 'feelslikeF'
-            self.tag['solarrad'] = 'solradWM2'
-            self.tag['sky'] = 'sky'
-            self.tag['temp_min'] = 'minTempF'
-            self.tag['temp_max'] = 'maxTempF'
-            self.tag['humidity_min'] = 'minHumidity'
-            self.tag['humidity_max'] = 'maxHumidity'
-            self.tag['wind_min'] = 'windSpeedMinMPH'
-            self.tag['wind_max'] = 'windSpeedMaxMPH'
-            self.tag['winddir_min'] = 'windDirMinDEG'
-            self.tag['winddir_max'] = 'windDirMaxDEG'
-            self.tag['uv'] = 'uvi'
-            self.tag['pop'] = 'pop'
-            self.tag['timestamp'] = 'timestamp'
-            self.tag['precip_summary'] = 'totalIN'
+            results.update(self.fetch_sequential(requests, deadline))
 
-    def query_conditions(self):
-        # Query for the current conditions. We can do this fairly
-        # frequently, probably as often as once a minute.
+        return results
+
+    def fetch_sequential(self, requests, deadline=None):
+        results = {}
+        for (s, extra) in requests:
+            if deadline is not None and deadline.expired():
+                LOGGER.warning('Poll deadline exceeded, skipping ' + extra + ' query for ' + s.location)
+                self.timed_out = True
+                results[(s, extra)] = None
+            else:
+                results[(s, extra)] = self.get_weather_data(extra, deadline=deadline, location=s.location)
+
+        return results
+
+    # Send the requests in parallel on a small worker pool and wait
+    # for all of them, or the deadline, before returning.
+    def fetch_concurrent(self, requests, deadline=None):
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.http.pool_size, thread_name_prefix='aeris')
 
+        futures = {}
+        for (s, extra) in requests:
+            futures[(s, extra)] = self.executor.submit(self.get_weather_data, extra, deadline=deadline, location=s.location)
+
+        timeout = None
+        if deadline is not None:
+            timeout = deadline.remaining()
+        (done, not_done) = concurrent.futures.wait(futures.values(), timeout=timeout)
+
+        results = {}
+        for (s, extra) in futures:
+            future = futures[(s, extra)]
+            if future in done:
+                results[(s, extra)] = future.result()
+            else:
+                # Requests already running will give up on their own
+                # when they notice the deadline has passed.
+                future.cancel()
+                LOGGER.warning('Poll deadline exceeded, abandoning ' + extra + ' query for ' + s.location)
+                self.timed_out = True
+                results[(s, extra)] = None
+
+        return results
+
+    # Switch to the shared unit profile for the Units setting
+    def set_units(self, units):
+        self.profile = uom.get_profile(units)
+        self.tag = self.profile.tags
+        self.fields = self.profile.fields
+        self.extractors = self.profile.extractors
+
+    # Fetch and process the data for the given list of endpoints.
+    # Cached responses are used unless bypass_cache is set.
+    def update(self, endpoints, bypass_cache=False):
         if not self.configured:
             LOGGER.info('Skipping connection because we aren\'t configured yet.')
             return
 
+        if len(endpoints) == 0:
+            return
+
+        requests = []
+        hourly_sites = self.hourly_sites()
+        for s in self.sites:
+            for extra in endpoints:
+                if extra == 'hourly' and s not in hourly_sites:
+                    continue
+                requests.append((s, extra))
+
+        # Collect all the driver changes and send them at the end
+        nodes = self.all_nodes()
+        for node in nodes:
+            node.start_driver_batch()
+        try:
+            self.update_nodes(endpoints, requests, bypass_cache)
+        finally:
+            for node in nodes:
+                node.flush_drivers()
+
+    # The controller and all the nodes it created
+    def all_nodes(self):
+        nodes = [self]
+        for address in self.nodes:
+            if self.nodes[address] is not self:
+                nodes.append(self.nodes[address])
+        return nodes
+
+    # Fetch the data for the (site, endpoint) requests and update the
+    # drivers with it.
+    def update_nodes(self, endpoints, requests, bypass_cache):
+        self.timed_out = False
+        with self.metrics.phase('fetch'):
+            (results, stale) = self.fetch_cached(requests, self.poll_deadline(), bypass_cache)
+
+        for extra in endpoints:
+            self.scheduler.schedule(extra)
+        if self.scheduler.budget > 0:
+            self.update_driver('GV23', self.scheduler.remaining())
+
+        if self.timed_out:
+            self.timeouts += 1
+            LOGGER.warning('Poll timed out, %d timeouts so far' % self.timeouts)
+            self.update_driver('GV21', self.timeouts)
+
+        self.update_data_age()
+
+        for s in self.sites:
+            precipitation = 0
+            if (s, 'observations') in results:
+                with self.metrics.phase('conditions'):
+                    precipitation = self.update_conditions(s, results[(s, 'observations')], (s, 'observations') not in stale)
+            if (s, 'observations/summary') in results:
+                with self.metrics.phase('summary'):
+                    self.update_summary(s, results[(s, 'observations/summary')], precipitation)
+            if (s, 'forecasts') in results:
+                with self.metrics.phase('forecasts'):
+                    self.update_forecasts(s, results[(s, 'forecasts')], (s, 'forecasts') not in stale)
+            if (s, 'hourly') in results:
+                with self.metrics.phase('hourly'):
+                    self.update_hourly(s, results[(s, 'hourly')])
+
+    # Show how old the main location's observation data is
+    def update_data_age(self):
+        primary = (self.sites[0].location, 'observations')
+        if primary in self.last_good:
+            age = (time.time() - self.last_good[primary][0]) / 60
+            self.update_driver('GV22', age, prec=0)
+
+    def query_conditions(self):
+        # Query for the current conditions. We can do this fairly
+        # frequently, probably as often as once a minute.
+        with self.metrics.phase('query_conditions'):
+            self.update(self.observations_due(self.due(['observations', 'observations/summary'])))
+        self.report_metrics('query_conditions')
+
+    def query_forecast(self):
+        with self.metrics.phase('query_forecast'):
+            self.update(self.refresh_due(self.due(self.forecast_endpoints())))
+        self.report_metrics('query_forecast')
+
+    # The endpoints queried on the long poll
+    def forecast_endpoints(self):
+        endpoints = ['forecasts']
+        if self.params.get('Hourly ETo').lower() == 'on' or self.hourly_node_count() > 0:
+            endpoints.append('hourly')
+        return endpoints
+
+    # The sites the hourly forecast is needed for.  The hourly nodes
+    # are only for the main location, the other sites only use it for
+    # the hourly ETo.
+    def hourly_sites(self):
+        if self.params.get('Hourly ETo').lower() == 'on':
+            return list(self.sites)
+        if self.hourly_node_count() > 0:
+            return self.sites[:1]
+        return []
+
+    def hourly_node_count(self):
+        try:
+            count = int(self.params.get('Hourly Nodes'))
+        except ValueError:
+            LOGGER.warning('Invalid Hourly Nodes, not showing hourly forecasts')
+            return 0
+        return max(0, min(count, aeris_hourly.MAX_HOURLY_NODES))
+
+    # Hourly periods to ask for.  They start at midnight, so there has
+    # to be a day's worth on top of the hourly nodes.
+    def hourly_hours(self):
+        days = min(max(int(self.params.get('Forecast Days')), 1), HOURLY_DAYS)
+        hours = 24 * days
+        if self.hourly_node_count() > 0:
+            hours = max(hours, 24 + self.hourly_node_count())
+        return hours
+
+    # Filter out the endpoints the scheduler says aren't due yet
+    def due(self, endpoints):
+        due = []
+        for extra in endpoints:
+            if self.scheduler.due(extra):
+                due.append(extra)
+            else:
+                LOGGER.debug('Skipping ' + extra + ' query to stay within the daily budget')
+        return due
+
+    # With Forecast Refresh set to adaptive, the forecasts are only
+    # fetched when the refresher expects them to have changed.  The
+    # cached forecasts are dropped then so they're really fetched.
+    def refresh_due(self, endpoints):
+        if 'forecasts' not in endpoints or self.params.get('Forecast Refresh').lower() != 'adaptive':
+            return endpoints
+
+        if self.refresher.due():
+            self.cache.invalidate('forecasts')
+            return endpoints
+
+        LOGGER.debug('Skipping forecasts query, not expecting an update until ' + time.ctime(self.refresher.next_refresh()))
+        self.metrics.count('forecast_refresh_skipped')
+        return [e for e in endpoints if e != 'forecasts']
+
+    # With Observation Refresh set to adaptive, the current conditions
+    # are only fetched when the stations are expected to have reported
+    # again.  The cached observations are dropped then so a new
+    # report isn't hidden by the cache.
+    def observations_due(self, endpoints):
+        if 'observations' not in endpoints or self.params.get('Observation Refresh').lower() != 'adaptive':
+            return endpoints
+
+        if not self.observer.due():
+            LOGGER.debug('Skipping observations query, not expecting a new report until ' + time.ctime(self.observer.next_refresh()))
+            self.metrics.count('observations_skipped')
+            self.update_data_age()
+            return []
+
+        self.cache.invalidate('observations')
+        return endpoints
+
+    # The node that shows the current conditions for a site
+    def site_node(self, s):
+        if s.node_address == self.address:
+            return self
+        return self.nodes[s.node_address]
+
+    # Process the current observation data, returns the current
+    # precipitation value to use if the summary isn't available.
+    # fetched is False for data that was already seen before, which
+    # the observation refresher doesn't learn from.
+    def update_conditions(self, s, jdata, fetched=True):
         precipitation = 0
+        node = self.site_node(s)
 
         try:
-            jdata = self.get_weather_data('observations')
             if jdata == None:
                 LOGGER.error('Current condition query returned no data')
-                return
+                return precipitation
             '''
             Data from query has multiple units. Which one we want to use depends
             on what the user has selected.  Since we set the node to metric by
@@ -236,59 +877,46 @@ class Controller(polyinterface.Controller):
             #jdata['response']['ob']['tempC']
             if 'response' not in jdata:
                 LOGGER.error('No response object in query response.')
-                return
+                return precipitation
 
             if 'ob' not in jdata['response']:
                 LOGGER.error('No observation object in query response.')
-                return
+                return precipitation
 
             if 'loc' in jdata['response']:
                 if 'lat' in jdata['response']['loc']:
-                    self.latitude = float(jdata['response']['loc']['lat'])
+                    s.latitude = float(jdata['response']['loc']['lat'])
                 else:
                     LOGGER.error('No latitude data in response.')
+                if 'long' in jdata['response']['loc']:
+                    s.longitude = float(jdata['response']['loc']['long'])
             else:
                 LOGGER.error('No location data in response.')
 
             ob = jdata['response']['ob']
+            if fetched:
+                self.metrics.count('observations_fetched')
+                if self.observer.expecting(s.location):
+                    self.metrics.count('observations_expected')
+                if self.observer.record(s.location, ob.get('timestamp')):
+                    self.metrics.count('observations_fresh')
 
-            self.update_driver('CLITEMP', ob[self.tag['temperature']])
-            self.update_driver('CLIHUM', ob[self.tag['humidity']])
-            self.update_driver('BARPRES', ob[self.tag['pressure']])
-            self.update_driver('SPEED', ob[self.tag['windspeed']])
-            self.update_driver('GV5', ob[self.tag['gustspeed']])
-            self.update_driver('WINDDIR', ob[self.tag['winddir']])
-            self.update_driver('DISTANC', ob[self.tag['visibility']])
-            self.update_driver('DEWPT', ob[self.tag['dewpoint']])
-            self.update_driver('GV3', ob[self.tag['heatindex']])
-            self.update_driver('GV4', ob[self.tag['windchill']])
-            self.update_driver('GV2', ob[self.tag['feelslike']])
-            self.update_driver('SOLRAD', ob[self.tag['solarrad']])
-            self.update_driver('UV', ob[self.tag['uv']])
-            self.update_driver('GV15', ob[self.tag['snow']])
-            # Weather conditions:
-            #  ob['weather']
-            #  ob['weatherShort']
-            #  ob['weatherCoded']
-            #    [coverage] : [intensity] : [weather]
-            #     -- these can be mapped to strings
-
-            LOGGER.debug('**>>> WeatherCoded = ' + ob['weatherCoded']);
-            weather = ob['weatherCoded'].split(':')[0]
-            self.update_driver('GV11', wx.coverage_codes(weather))
-            weather = ob['weatherCoded'].split(':')[1]
-            self.update_driver('GV12', wx.intensity_codes(weather))
-            weather = ob['weatherCoded'].split(':')[2]
-            LOGGER.debug('>>>  weather = ' + weather)
-            self.update_driver('GV13', wx.weather_codes(weather))
-            LOGGER.debug('>>>  Setting GV13 to ' + str(wx.weather_codes(weather)))
-
-            # cloud cover
-            #  ob['cloudsCoded'] ??
-            self.update_driver('GV14', ob['sky'])
+            # Nothing to do if the station hasn't reported anything
+            # new since the last update.
+            timestamp = ob.get('timestamp')
+            if not self.force and timestamp is not None and timestamp == s.last_ob_timestamp:
+                LOGGER.debug('Observation timestamp %d unchanged, skipping update' % timestamp)
+                return s.last_precipitation
+
+            # Set all the drivers that have data
+            for (driver, value, prec) in self.extractors['observations'].extract(ob):
+                node.update_driver(driver, value, prec=prec)
 
             # precipitation
-            precipitation = ob[self.tag['precipitation']]
+            precipitation = ob.get(self.tag['precipitation'], 0)
+
+            s.last_ob_timestamp = timestamp
+            s.last_precipitation = precipitation
 
             '''
             TODO:
@@ -302,9 +930,12 @@ class Controller(polyinterface.Controller):
             LOGGER.error('Current observation update failure')
             LOGGER.error(e)
 
+        return precipitation
+
+    # Process the precipitation summary data
+    def update_summary(self, s, jdata, precipitation):
+        node = self.site_node(s)
         try:
-            # Get precipitation summary
-            jdata = self.get_weather_data('observations/summary')
             if jdata == None:
                 LOGGER.error('Precipitation summary query returned no data')
                 return
@@ -318,75 +949,200 @@ class Controller(polyinterface.Controller):
                 rd = jdata['response']['periods'][0]['summary']
             if 'precip' in rd:
                 LOGGER.debug('Setting precipitation to: ' + str(rd['precip'][self.tag['precip_summary']]))
-                self.update_driver('GV6', rd['precip'][self.tag['precip_summary']])
+                node.update_driver('GV6', rd['precip'][self.tag['precip_summary']])
         except Exception as e:
             LOGGER.error('Precipitation summary update failure')
             LOGGER.error(e)
-            self.update_driver('GV6', precipitation)
-                
-
-    def query_forecast(self):
-        if not self.configured:
-            LOGGER.info('Skipping connection because we aren\'t configured yet.')
-            return
+            node.update_driver('GV6', precipitation)
 
+    # Process the forecast data.  fetched is False for data that was
+    # already seen before, which the forecast refresher doesn't learn
+    # from.
+    def update_forecasts(self, s, jdata, fetched=True):
         try:
-            jdata = self.get_weather_data('forecasts')
             if jdata == None:
                 LOGGER.error('Current condition query returned no data')
                 return
 
             # Records are for each day, midnight to midnight
-            day = 0
             if 'periods' in jdata['response'][0]:
-                LOGGER.debug('Processing periods: %d' % len(jdata['response'][0]['periods']))
-                for forecast in jdata['response'][0]['periods']:
-                    address = 'forecast_' + str(day)
+                periods = jdata['response'][0]['periods'][:int(self.params.get('Forecast Days'))]
+
+                # Each period is identified by a hash of its contents
+                # so periods that haven't changed since the last update
+                # can be skipped and periods that have moved to another
+                # day (after midnight) can be shown again without
+                # working out their values.
+                context = (s.latitude, s.elevation, s.plant_type, self.profile.name)
+                hashes = [site.period_hash(p, context) for p in periods]
+                if fetched and self.refresher.record(s.location, [p.get('timestamp') for p in periods], hashes):
+                    LOGGER.info('Forecast for ' + s.location + ' was updated')
+                    self.metrics.count('forecast_issues')
+                if not self.force and hashes == s.forecast_hashes:
+                    LOGGER.debug('Forecast periods %s unchanged, skipping update' % str([p.get('timestamp') for p in periods]))
+                    return
+                if len(hashes) > 1 and hashes[:-1] == s.forecast_hashes[1:len(hashes)]:
+                    LOGGER.info('Forecast for ' + s.location + ' moved on a day')
+
+                LOGGER.debug('Processing periods: %d' % len(periods))
+                solar = s.solar_table()
+                values = {}
+                for (day, forecast) in enumerate(periods):
+                    address = s.forecast_address(day)
+                    h = hashes[day]
+                    if not self.force and h in s.forecast_values:
+                        values[h] = s.forecast_values[h]
+                        if day < len(s.forecast_hashes) and s.forecast_hashes[day] == h:
+                            self.metrics.count('forecast_unchanged')
+                            continue
+                        LOGGER.debug(' >>>>   period ' + forecast['dateTimeISO'] + '  moved to ' + address)
+                        self.metrics.count('forecast_moved')
+                        self.nodes[address].show_values(values[h], False)
+                        continue
+
                     LOGGER.debug(' >>>>   period ' + forecast['dateTimeISO'] + '  ' + address)
-                    self.nodes[address].update_forecast(forecast, self.latitude, self.params.get('Elevation'), self.params.get('Plant Type'), self.tag, self.force)
-                    day += 1
-                    if day >= int(self.params.get('Forecast Days')):
-                        return
+                    self.metrics.count('forecast_computed')
+                    with self.metrics.phase('update_forecast'):
+                        values[h] = self.nodes[address].update_forecast(forecast, s.latitude, s.elevation, s.plant_type, self.tag, self.force, self.extractors['forecasts'], solar)
+
+                # Only the values of the periods being shown are kept
+                s.forecast_hashes = hashes
+                s.forecast_values = values
 
         except Exception as e:
             LOGGER.error('Forecast data failure: ' + str(e))
 
 
+    # Forget what was last processed so the next update isn't skipped
+    def reset_tracking(self):
+        for s in self.sites:
+            s.reset_tracking()
+
+    # A manual query always gets fresh data
     def query(self):
+        self.worker.submit('query', self.query_all)
+
+    def query_all(self):
+        self.update(['observations', 'observations/summary'] + self.forecast_endpoints(), bypass_cache=True)
         for node in self.nodes:
             self.nodes[node].reportDrivers()
 
+    # Process the hourly forecast.  The periods are decoded and used
+    # one at a time and only the running daily ETo totals are kept.
+    #
+    # The first hourly nodes show the hours that haven't ended yet.
+    # With Hourly ETo on, the daily ETo totals replace the estimates
+    # for the forecast days that are fully covered.
+    def update_hourly(self, s, response):
+        try:
+            if response == None:
+                LOGGER.error('Hourly forecast query returned no data')
+                return
+
+            eto = hourly.HourlyEto(s.latitude, s.longitude, float(s.elevation), float(s.plant_type), self.profile)
+            nodes = 0
+            if s is self.sites[0]:
+                nodes = self.hourly_node_count()
+
+            # The nodes are only updated once the whole response has
+            # been read, a truncated one raises part way through.
+            now = time.time()
+            hours = []
+            for period in response.periods():
+                try:
+                    value = eto.add(period)
+                except KeyError as e:
+                    LOGGER.warning('Missing %s data, skipping hourly ETo' % str(e))
+                    value = None
+
+                if len(hours) < nodes and int(period['timestamp']) + 3600 > now:
+                    hours.append((period, value))
+
+            for (hour, (period, value)) in enumerate(hours):
+                self.nodes[aeris_hourly.hourly_address(hour)].update_hour(period, value, self.force, self.extractors['hourly'])
+
+            if self.params.get('Hourly ETo').lower() != 'on':
+                return
+
+            num_days = int(self.params.get('Forecast Days'))
+            for (day, total) in eto.days():
+                if day < num_days:
+                    LOGGER.debug('Hourly ETo for %s day %d = %f' % (s.location, day, total))
+                    s.remember_value(day, self.nodes[s.forecast_address(day)].set_eto(total, self.force))
+
+        except Exception as e:
+            LOGGER.error('Hourly forecast data failure: ' + str(e))
+
     def discover(self, *args, **kwargs):
         # Create any additional nodes here
         LOGGER.info("In Discovery...")
 
         num_days = int(self.params.get('Forecast Days'))
-        if num_days < 7:
-            # delete any extra days
-            for day in range(num_days, 7):
-                address = 'forecast_' + str(day)
+
+        # delete the nodes for locations that have been removed
+        for n in range(len(self.sites), site.MAX_SITES):
+            self.delete_node(site.conditions_address(n))
+            for day in range(0, 7):
+                self.delete_node(site.forecast_prefix(n) + str(day))
+
+        for s in self.sites:
+            if s.node_address != self.address:
                 try:
-                    self.delNode(address)
+                    node = aeris_conditions.ConditionsNode(self, self.address, s.node_address, s.name)
+                    self.addNode(node)
                 except:
-                    LOGGER.debug('Failed to delete node ' + address)
+                    LOGGER.error('Failed to create conditions node ' + s.name)
+
+            if num_days < 7:
+                # delete any extra days
+                for day in range(num_days, 7):
+                    self.delete_node(s.forecast_address(day))
 
-        for day in range(0,num_days):
-            address = 'forecast_' + str(day)
-            title = 'Forecast ' + str(day)
+            for day in range(0,num_days):
+                address = s.forecast_address(day)
+                title = 'Forecast ' + str(day)
+                if s.node_address != self.address:
+                    title = s.name + ' ' + title
+                try:
+                    node = aeris_daily.DailyNode(self, self.address, address, title)
+                    self.addNode(node)
+                except:
+                    LOGGER.error('Failed to create forecast node ' + title)
+
+        # Hourly forecast nodes are only made for the main location
+        num_hours = self.hourly_node_count()
+        for hour in range(num_hours, aeris_hourly.MAX_HOURLY_NODES):
+            self.delete_node(aeris_hourly.hourly_address(hour))
+
+        for hour in range(0, num_hours):
+            address = aeris_hourly.hourly_address(hour)
+            title = 'Hourly Forecast ' + str(hour)
             try:
-                node = aeris_daily.DailyNode(self, self.address, address, title)
+                node = aeris_hourly.HourlyNode(self, self.address, address, title)
                 self.addNode(node)
             except:
-                LOGGER.error('Failed to create forecast node ' + title)
+                LOGGER.error('Failed to create hourly forecast node ' + title)
 
         self.set_driver_uom(self.params.get('Units'))
 
+    def delete_node(self, address):
+        try:
+            # Only bother Polyglot about nodes it knows about
+            if address in self.nodes or self.poly.getNode(address):
+                self.delNode(address)
+        except:
+            LOGGER.debug('Failed to delete node ' + address)
+
     # Delete the node server from Polyglot
     def delete(self):
         LOGGER.info('Removing node server')
 
     def stop(self):
         LOGGER.info('Stopping node server')
+        self.worker.stop(self.poll_deadline().budget)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.http.close()
 
     def update_profile(self, command):
         st = self.poly.installprofile()
@@ -411,10 +1167,14 @@ class Controller(polyinterface.Controller):
     # Set the uom dictionary based on current user units preference
     def set_driver_uom(self, units):
         LOGGER.info('Configure driver units to ' + units)
-        self.uom = uom.get_uom(units)
-        for day in range(0, int(self.params.get('Forecast Days'))):
-            address = 'forecast_' + str(day)
-            self.nodes[address].set_driver_uom(units)
+        self.uom = uom.get_profile(units).uom
+        for s in self.sites:
+            if s.node_address != self.address:
+                self.nodes[s.node_address].set_driver_uom(units)
+            for day in range(0, int(self.params.get('Forecast Days'))):
+                self.nodes[s.forecast_address(day)].set_driver_uom(units)
+        for hour in range(0, self.hourly_node_count()):
+            self.nodes[aeris_hourly.hourly_address(hour)].set_driver_uom(units)
 
     def remove_notices_all(self, command):
         self.removeNoticesAll()
@@ -468,6 +1228,11 @@ class Controller(polyinterface.Controller):
             {'driver': 'DISTANC', 'value': 0, 'uom': 83},  # visibility
             {'driver': 'SOLRAD', 'value': 0, 'uom': 74},   # solar radiataion
             {'driver': 'UV', 'value': 0, 'uom': 71},       # uv index
+            {'driver': 'GV21', 'value': 0, 'uom': 56},     # poll timeouts
+            {'driver': 'GV22', 'value': 0, 'uom': 45},     # data age
+            {'driver': 'GV23', 'value': 0, 'uom': 56},     # remaining API quota
+            {'driver': 'GV24', 'value': 0, 'uom': 42},     # last poll duration
+            {'driver': 'GV25', 'value': 0, 'uom': 56},     # request errors
             {'driver': 'GVP', 'value': 30, 'uom': 25},     # log level
             ]
 
@@ -0,0 +1,41 @@
+# Node definition for the current conditions at an extra location
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+
+from nodes import uom
+import node_funcs
+
+LOGGER = polyinterface.LOGGER
+
+@node_funcs.add_functions_as_methods(node_funcs.functions)
+class ConditionsNode(polyinterface.Node):
+    id = 'conditions'
+    drivers = [
+            {'driver': 'CLITEMP', 'value': 0, 'uom': 4},   # temperature
+            {'driver': 'CLIHUM', 'value': 0, 'uom': 22},   # humidity
+            {'driver': 'DEWPT', 'value': 0, 'uom': 4},     # dewpoint
+            {'driver': 'BARPRES', 'value': 0, 'uom': 117}, # pressure
+            {'driver': 'WINDDIR', 'value': 0, 'uom': 76},  # direction
+            {'driver': 'SPEED', 'value': 0, 'uom': 32},    # wind speed
+            {'driver': 'GV5', 'value': 0, 'uom': 32},      # gust speed
+            {'driver': 'GV2', 'value': 0, 'uom': 4},       # feels like
+            {'driver': 'GV3', 'value': 0, 'uom': 4},       # heat index
+            {'driver': 'GV4', 'value': 0, 'uom': 4},       # wind chill
+            {'driver': 'GV6', 'value': 0, 'uom': 82},      # rain
+            {'driver': 'GV15', 'value': 0, 'uom': 82},     # snow depth
+            {'driver': 'GV11', 'value': 0, 'uom': 25},     # climate coverage
+            {'driver': 'GV12', 'value': 0, 'uom': 25},     # climate intensity
+            {'driver': 'GV13', 'value': 0, 'uom': 25},     # climate conditions
+            {'driver': 'GV14', 'value': 0, 'uom': 22},     # cloud conditions
+            {'driver': 'DISTANC', 'value': 0, 'uom': 83},  # visibility
+            {'driver': 'SOLRAD', 'value': 0, 'uom': 74},   # solar radiataion
+            {'driver': 'UV', 'value': 0, 'uom': 71},       # uv index
+            ]
+
+    def set_driver_uom(self, units):
+        self.profile = uom.get_profile(units)
+        self.uom = self.profile.uom
+        self.units = self.profile.name
@@ -6,11 +6,9 @@ except ImportError:
     import pgc_interface as polyinterface
 
 import json
-import time
 import datetime
 from nodes import et3
 from nodes import uom
-from nodes import weather_codes as wx
 import node_funcs
 
 LOGGER = polyinterface.LOGGER
@@ -60,73 +58,77 @@ class DailyNode(polyinterface.Node):
             }
 
     def set_driver_uom(self, units):
-        self.uom = uom.get_uom(units)
-        self.units = units
+        self.profile = uom.get_profile(units)
+        self.uom = self.profile.uom
+        self.units = self.profile.name
 
     def mm2inch(self, mm):
         return mm/25.4
 
 
-    def update_forecast(self, forecast, latitude, elevation, plant_type, tags, force):
+    # Show a forecast period.  Returns the list of (driver, value,
+    # precision) set, so they can be shown again without working them
+    # out if the period moves to another node.
+    def update_forecast(self, forecast, latitude, elevation, plant_type, tags, force, extractor=None, solar=None):
+        values = self.forecast_values(forecast, latitude, elevation, plant_type, tags, extractor, solar)
+        self.show_values(values, force)
+        return values
+
+    def show_values(self, values, force):
+        for (driver, value, prec) in values:
+            self.update_driver(driver, value, force, prec=prec)
+
+    def forecast_values(self, forecast, latitude, elevation, plant_type, tags, extractor=None, solar=None):
 
         epoch = int(forecast['timestamp'])
-        dow = time.strftime("%w", time.gmtime(epoch))
-        LOGGER.info('Day of week = ' + dow)
-        LOGGER.info(tags)
+        LOGGER.debug('Forecast for ' + forecast.get('dateTimeISO', str(epoch)))
 
-        humidity = (forecast[tags['humidity_min']] + forecast[tags['humidity_max']]) / 2
-        try:
-            self.update_driver('CLIHUM', humidity, force, prec=0)
-            self.update_driver('BARPRES', forecast[tags['pressure']], force, prec=1)
-            self.update_driver('GV0', forecast[tags['temp_max']], force, prec=1)
-            self.update_driver('GV1', forecast[tags['temp_min']], force, prec=1)
-            self.update_driver('GV14', forecast['sky'], force, prec=0)
-            self.update_driver('SPEED', forecast[tags['windspeed']], force, prec=1)
-            self.update_driver('GV5', forecast[tags['gustspeed']], force, prec=1)
-            self.update_driver('GV6', forecast[tags['precipitation']], force, prec=1)
-            self.update_driver('GV7', forecast[tags['wind_max']], force, prec=1)
-            self.update_driver('GV8', forecast[tags['wind_min']], force, prec=1)
-            if tags['snowf'] in forecast:
-                if self.units == 'metric':
-                    snow = float(forecast[tags['snowf']]) * 10
-                else:
-                    snow = float(forecast[tags['snowf']])
-
-                self.update_driver('GV15', snow, force, prec=2)
-            self.update_driver('GV19', int(dow), force)
-            self.update_driver('UV', forecast['uvi'], force, prec=1)
-            self.update_driver('GV18', forecast['pop'], force, prec=1)
-
-            LOGGER.debug('Forecast coded weather = ' + forecast['weatherPrimaryCoded'])
-            weather = forecast['weatherPrimaryCoded'].split(':')[0]
-            self.update_driver('GV11', wx.coverage_codes(weather), force)
-            weather = forecast['weatherPrimaryCoded'].split(':')[1]
-            self.update_driver('GV12', wx.intensity_codes(weather), force)
-            weather = forecast['weatherPrimaryCoded'].split(':')[2]
-            self.update_driver('GV13', wx.weather_codes(weather), force)
-
-        except Exception as e:
-            LOGGER.error('Forcast: ' + str(e))
+        if extractor is None:
+            extractor = self.profile.extractors['forecasts']
+
+        # All the drivers that have data
+        values = extractor.extract(forecast)
 
         # Calculate ETo
         #  Temp is in degree C and windspeed is in m/s, we may need to
         #  convert these.
         J = datetime.datetime.fromtimestamp(epoch).timetuple().tm_yday
 
-        Tmin = forecast[tags['temp_min']]
-        Tmax = forecast[tags['temp_max']]
-        Ws = forecast[tags['windspeed']]
-        if self.units != 'metric':
-            LOGGER.info('Conversion of temperature/wind speed required')
+        try:
+            Tmin = forecast[tags['temp_min']]
+            Tmax = forecast[tags['temp_max']]
+            Ws = forecast[tags['windspeed']]
+            Hmax = forecast[tags['humidity_max']]
+            Hmin = forecast[tags['humidity_min']]
+        except KeyError as e:
+            LOGGER.warning('Missing %s data, skipping ETo calculation' % str(e))
+            return values
+
+        if solar is not None and not solar.matches(latitude, float(elevation)):
+            solar = None
+
+        if self.profile.temperature == 'F':
             Tmin = et3.FtoC(Tmin)
             Tmax = et3.FtoC(Tmax)
+        if self.profile.speed == 'mph':
             Ws = et3.mph2ms(Ws)
         else:
             Ws = et3.kph2ms(Ws)
 
-        et0 = et3.evapotranspriation(Tmax, Tmin, None, Ws, float(elevation), forecast[tags['humidity_max']], forecast[tags['humidity_min']], latitude, float(plant_type), J)
-        if self.units == 'metric' or self.units == 'si' or self.units.startswith('m'):
-            self.update_driver('GV20', round(et0, 2), force)
-        else:
-            self.update_driver('GV20', self.mm2inch(et0), force, prec=3)
+        with self.controller.metrics.phase('eto'):
+            et0 = et3.evapotranspriation(Tmax, Tmin, None, Ws, float(elevation), Hmax, Hmin, latitude, float(plant_type), J, solar)
+        values.append(self.eto_value(et0))
+        return values
+
+    # The (driver, value, precision) for the day's ETo, et0 is in mm
+    def eto_value(self, et0):
         LOGGER.info("ETo = %f %f" % (et0, self.mm2inch(et0)))
+        if self.profile.rain == 'mm':
+            return ('GV20', round(et0, 2), 3)
+        return ('GV20', self.mm2inch(et0), 3)
+
+    # Show the day's ETo, returns the (driver, value, precision) set
+    def set_eto(self, et0, force):
+        value = self.eto_value(et0)
+        self.show_values([value], force)
+        return value
@@ -0,0 +1,57 @@
+# Node definition for an hourly (intraday) forecast node
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+
+from nodes import uom
+import node_funcs
+
+LOGGER = polyinterface.LOGGER
+
+# Most hourly forecast nodes that can be created
+MAX_HOURLY_NODES = 24
+
+def hourly_address(hour):
+    return 'hourly_' + str(hour)
+
+@node_funcs.add_functions_as_methods(node_funcs.functions)
+class HourlyNode(polyinterface.Node):
+    id = 'hourly'
+    drivers = [
+            {'driver': 'CLITEMP', 'value': 0, 'uom': 4},   # temperature
+            {'driver': 'CLIHUM', 'value': 0, 'uom': 22},   # humidity
+            {'driver': 'SPEED', 'value': 0, 'uom': 32},    # wind speed
+            {'driver': 'GV5', 'value': 0, 'uom': 32},      # gust speed
+            {'driver': 'SOLRAD', 'value': 0, 'uom': 74},   # solar radiation
+            {'driver': 'GV6', 'value': 0, 'uom': 82},      # precipitation
+            {'driver': 'GV18', 'value': 0, 'uom': 22},     # pop
+            {'driver': 'GV14', 'value': 0, 'uom': 22},     # clouds
+            {'driver': 'GV11', 'value': 0, 'uom': 25},     # coverage
+            {'driver': 'GV12', 'value': 0, 'uom': 25},     # intensity
+            {'driver': 'GV13', 'value': 0, 'uom': 25},     # weather
+            {'driver': 'GV16', 'value': 0, 'uom': 82},     # ETo for the hour
+            ]
+
+    def set_driver_uom(self, units):
+        self.profile = uom.get_profile(units)
+        self.uom = self.profile.uom
+        self.units = self.profile.name
+
+    # Show a forecast period and its ETo (mm, None if it couldn't be
+    # worked out)
+    def update_hour(self, period, eto, force, extractor=None):
+        if extractor is None:
+            extractor = self.profile.extractors['hourly']
+
+        for (driver, value, prec) in extractor.extract(period):
+            self.update_driver(driver, value, force, prec=prec)
+
+        if eto is None:
+            return
+        eto = max(0.0, eto)
+        if self.profile.rain == 'mm':
+            self.update_driver('GV16', eto, force, prec=2)
+        else:
+            self.update_driver('GV16', eto / 25.4, force, prec=3)
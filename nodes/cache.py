@@ -0,0 +1,65 @@
+# Response cache for the AERIS queries.
+#
+# AERIS stations only report every so often, so polling faster than
+# that just downloads the same data again.  Successful responses are
+# cached for a time that depends on the endpoint and least recently
+# used entries are dropped once the cache is full.
+
+import time
+import threading
+import collections
+
+# Seconds to keep a response, by endpoint
+DEFAULT_TTL = {
+        'observations': 180,
+        'observations/summary': 900,
+        'forecasts': 3 * 3600,
+        }
+
+MAX_ENTRIES = 32
+
+class ResponseCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = dict(ttl)
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(endpoint, location, query):
+        return (endpoint, location, query)
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                (expires, data) = self.entries[key]
+                if time.monotonic() < expires:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return data
+                del self.entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, data):
+        ttl = self.ttl.get(key[0], 0)
+        if ttl <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, data)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    # Drop the cached responses for an endpoint, or everything.
+    def invalidate(self, endpoint=None):
+        with self.lock:
+            if endpoint is None:
+                self.entries.clear()
+            else:
+                for key in [k for k in self.entries if k[0] == endpoint]:
+                    del self.entries[key]
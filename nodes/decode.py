@@ -0,0 +1,249 @@
+# JSON decoding of the AERIS responses.
+#
+# Uses the fastest JSON library that's installed, falling back to the
+# standard library json module.  Optional decoders are tried in order:
+#   orjson, ujson
+#
+# Also keeps track of how many bytes are received and how long they
+# take to decode for each endpoint.  A batch response is counted
+# against the endpoints of the responses in it.
+#
+# Responses with a lot of periods, like the hourly forecast, can be
+# wrapped with stream() instead so each period is only read and
+# decoded when it's used.
+
+import re
+import time
+import codecs
+import json
+import threading
+
+def _orjson():
+    import orjson
+    return orjson.loads
+
+def _ujson():
+    import ujson
+    return ujson.loads
+
+DECODERS = [
+        ('orjson', _orjson),
+        ('ujson', _ujson),
+        ]
+
+# Return (name, loads function) for the preferred decoder.  If name
+# is given, only that decoder is tried.
+def get_decoder(name=None):
+    for (decoder, load) in DECODERS:
+        if name is not None and name != decoder:
+            continue
+        try:
+            return (decoder, load())
+        except ImportError:
+            pass
+
+    return ('json', json.loads)
+
+(decoder_name, loads) = get_decoder()
+
+class DecodeStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def record(self, endpoint, size, seconds):
+        with self.lock:
+            if endpoint not in self.stats:
+                self.stats[endpoint] = {'count': 0, 'bytes': 0, 'time': 0.0, 'last_bytes': 0, 'last_time': 0.0}
+            s = self.stats[endpoint]
+            s['count'] += 1
+            s['bytes'] += size
+            s['time'] += seconds
+            s['last_bytes'] = size
+            s['last_time'] = seconds
+
+    # Record a batch response, sharing its size and decode time
+    # equally among the endpoints of the responses in it
+    def record_batch(self, endpoints, size, seconds):
+        for endpoint in endpoints:
+            self.record(endpoint, size / len(endpoints), seconds / len(endpoints))
+
+    def get(self, endpoint):
+        with self.lock:
+            if endpoint in self.stats:
+                return dict(self.stats[endpoint])
+            return None
+
+    def endpoints(self):
+        with self.lock:
+            return list(self.stats.keys())
+
+# Decode a response body, recording its size and decode time.  For a
+# batch response, parts is the endpoint of each response in it.
+def decode(body, endpoint, stats=None, parts=None):
+    start = time.perf_counter()
+    data = loads(body)
+    if stats is not None:
+        if parts is not None:
+            stats.record_batch(parts, len(body), time.perf_counter() - start)
+        else:
+            stats.record(endpoint, len(body), time.perf_counter() - start)
+    return data
+
+SUCCESS = re.compile(r'"success"\s*:\s*(true|false)')
+PERIODS = re.compile(r'"periods"\s*:\s*\[')
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+SEPARATOR = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+
+_period_decoder = json.JSONDecoder()
+
+# Characters kept from the end of a response to check it's complete
+TAIL = 16
+
+# A response whose periods are decoded one at a time as they're
+# iterated over, instead of all at once.  body is an iterable of the
+# response body's chunks (or the whole body), and is only read as far
+# as the periods that have been used, so neither the body nor the
+# decoded periods are ever all held at the same time.
+#
+# Only the success flag, which AERIS sends before the data, is looked
+# at up front.  A truncated response is found once the periods have
+# been read, periods() raises ValueError then.  The periods can only
+# be iterated over once.
+class StreamedResponse:
+    def __init__(self, body, endpoint='', stats=None):
+        if isinstance(body, (bytes, str)):
+            body = [body]
+        self.body = body
+        self.chunks = iter(body)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.endpoint = endpoint
+        self.stats = stats
+        self.buffer = ''
+        self.pos = 0
+        self.size = 0
+        self.time = 0.0
+
+        start = time.perf_counter()
+        try:
+            # Read up to the start of the periods
+            match = PERIODS.search(self.buffer)
+            while match is None and self._more():
+                match = PERIODS.search(self.buffer)
+            flag = SUCCESS.search(self.buffer)
+            self.success = flag is not None and flag.group(1) == 'true'
+            if match is None:
+                # The whole body has been read
+                self.periods_start = None
+                self.success = self.success and self.buffer.rstrip().endswith('}')
+                self._done()
+            else:
+                self.periods_start = match.end()
+        finally:
+            self.time += time.perf_counter() - start
+
+    # Enough of the dictionary interface for the response checks
+    def get(self, key, default=None):
+        if key == 'success':
+            return self.success
+        return default
+
+    # Read the next chunk, dropping the text that's been used.  Returns
+    # False at the end of the body.
+    def _more(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+        if isinstance(chunk, bytes):
+            self.size += len(chunk)
+            chunk = self.decoder.decode(chunk)
+        else:
+            self.size += len(chunk)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    # The next character that isn't whitespace
+    def _next(self):
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._more():
+                raise ValueError('%s response is truncated' % self.endpoint)
+
+    # Read the rest of the body to check it's complete
+    def _finish(self):
+        last = ''
+        while True:
+            text = self.buffer[self.pos:].rstrip()
+            if text != '':
+                last = text[-1]
+            self.pos = len(self.buffer)
+            if not self._more():
+                break
+        if last != '}':
+            raise ValueError('%s response is truncated' % self.endpoint)
+
+    def _done(self):
+        close = getattr(self.body, 'close', None)
+        if close is not None:
+            close()
+        self.buffer = ''
+        self.pos = 0
+        if self.stats is not None:
+            self.stats.record(self.endpoint, self.size, self.time)
+            self.stats = None
+
+    # Generate the periods of the (first) response
+    def periods(self):
+        if self.periods_start is None:
+            return
+
+        self.pos = self.periods_start
+        self.periods_start = None
+        start = time.perf_counter()
+        try:
+            if self._next() != ']':
+                while True:
+                    try:
+                        (period, self.pos) = _period_decoder.raw_decode(self.buffer, self.pos)
+                    except ValueError:
+                        # Wait for the rest of the period
+                        if not self._more():
+                            raise ValueError('%s response is truncated' % self.endpoint)
+                        continue
+
+                    # Don't count the time spent using the period
+                    self.time += time.perf_counter() - start
+                    start = None
+                    yield period
+                    start = time.perf_counter()
+
+                    # Usually the separator and the start of the next
+                    # period are already in the buffer.
+                    match = SEPARATOR.match(self.buffer, self.pos)
+                    if match is not None and match.end() < len(self.buffer):
+                        self.pos = match.end()
+                        if match.group(1) == ']':
+                            break
+                        continue
+
+                    c = self._next()
+                    if c == ']':
+                        break
+                    if c != ',':
+                        raise ValueError('Bad %s periods' % self.endpoint)
+                    self.pos += 1
+                    self._next()
+            self._finish()
+        finally:
+            if start is not None:
+                self.time += time.perf_counter() - start
+            self._done()
+
+# Wrap a response body, or an iterable of its chunks, for streamed
+# decoding.  Its size and the time taken to read and decode it are
+# recorded once it's been read.
+def stream(body, endpoint, stats=None):
+    return StreamedResponse(body, endpoint, stats)
@@ -5,6 +5,14 @@
 # http://edis.ifas.ufl.edu/pdffiles/ae/ae45900.pdf
 
 import math
+import time
+
+# NumPy is only needed for evapotranspiration_batch().  Without it the
+# batch is worked out one day at a time with the scalar function.
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # Formulas and constants
 vaporRate = 237.3
@@ -87,8 +95,8 @@ def long_wave_radiation(min_t, max_t, vp, sr, clear_sky):
     rel4 = 1.35 * sr / clear_sky - 0.35;
     return rel1 * rel2 * rel3 * rel4;
 
-# calculate the approx. solar radiation  in mega-joules/m2
-def calc_solar_radiation(t_min, t_max, lat, declination, julian_day):
+# extraterrestrial radiation used to estimate the solar radiation
+def estimated_extraterrestrial_radiation(lat, declination, julian_day):
 
     Dr = 1.0 + 0.033 * math.cos(2 * math.pi / 365 * julian_day)
 
@@ -100,22 +108,91 @@ def calc_solar_radiation(t_min, t_max, lat, declination, julian_day):
 
     omega = math.acos(omega_pre)
 
-    Ra = 24.0 / math.pi * 4.92 * Dr * (omega * math.sin(lat) * math.sin(declination) + math.cos(lat) * math.cos(declination) * math.sin(omega))
+    return 24.0 / math.pi * 4.92 * Dr * (omega * math.sin(lat) * math.sin(declination) + math.cos(lat) * math.cos(declination) * math.sin(omega))
+
+# calculate the approx. solar radiation  in mega-joules/m2
+def calc_solar_radiation(t_min, t_max, lat, declination, julian_day):
+    Ra = estimated_extraterrestrial_radiation(lat, declination, julian_day)
+    return estimate_solar_radiation(t_min, t_max, Ra)
+
+def estimate_solar_radiation(t_min, t_max, Ra):
+    return 0.17 * math.sqrt(t_max - t_min) * Ra
+
+# The radiation terms that only depend on the location and day of the
+# year: (estimated extraterrestrial radiation, clear sky radiation).
+# The clear sky radiation is None on days the sun doesn't rise or set.
+def solar_terms(latitude_r, elevation, julian_day):
+    # step 12.1, relative sun earth distance
+    dist = relative_earth_sun_distance(julian_day)
+
+    # step 12.2, solar declination
+    declination = solar_declination(julian_day)
+
+    Ra_est = estimated_extraterrestrial_radiation(latitude_r, declination, julian_day)
+
+    # step 14, sunset hour angle
+    try:
+        angle = sunset_hour_angle(latitude_r, declination)
+    except ValueError:
+        return (Ra_est, None)
+
+    # step 15, extraerrestrial radiation
+    Ra = extraterrestrial_radiation(dist, angle, latitude_r, declination)
+
+    # step 16, clear sky solar radiation
+    Rso = clear_sky_solar_radiation(elevation, Ra)
+
+    return (Ra_est, Rso)
 
-    Rs = 0.17 * math.sqrt(t_max - t_min) * Ra
+# The solar_terms() for every day of the year at a location, along
+# with the psychrometric constant for its elevation.  Built once per
+# location so the daily ETo calculation only has to look them up.
+class SolarTable:
+    def __init__(self, latitude, elevation):
+        self.latitude = latitude
+        self.elevation = elevation
 
-    return Rs
-    
+        # step 5 and 6, atmospheric pressure and psychrometric constant
+        self.psychrometric = psychrometric_constant(atmospheric_pressure(elevation))
+
+        # step 13, latitude in radians
+        latitude_r = deg2rad(latitude)
+        self.days = [solar_terms(latitude_r, elevation, day) for day in range(1, 367)]
+
+    def matches(self, latitude, elevation):
+        return self.latitude == latitude and self.elevation == elevation
+
+    def lookup(self, julian_day):
+        return self.days[julian_day - 1]
 
 # temperature in C
 # elevation in meters
 # latitude in degrees
 # avg_ws in m/s
 # solar_radiation in W/m2
-def evapotranspriation(max_t, min_t, solar_radiation, avg_ws, elevation, max_h, min_h, latitude, canopy_coefficient, day):
+#
+# If the SolarTable for the location is passed as solar, the location
+# dependent terms come from it and latitude and elevation aren't used.
+def evapotranspriation(max_t, min_t, solar_radiation, avg_ws, elevation, max_h, min_h, latitude, canopy_coefficient, day, solar=None):
 
     julian_day = day
 
+    if solar is None:
+        # step 5, atmospheric pressure
+        pressure = atmospheric_pressure(elevation)
+
+        # step 6, psychrometric constant
+        psychrometric = psychrometric_constant(pressure)
+
+        # steps 12 - 16, radiation terms for the location and day
+        (Ra_est, Rso) = solar_terms(deg2rad(latitude), elevation, julian_day)
+    else:
+        psychrometric = solar.psychrometric
+        (Ra_est, Rso) = solar.lookup(julian_day)
+
+    if Rso is None:
+        raise ValueError('no sunrise or sunset on day %d' % julian_day)
+
     # step 1, mean daily air temperature C
     mean_daily_temp = (max_t + min_t) / 2.0
 
@@ -125,12 +202,6 @@ def evapotranspriation(max_t, min_t, solar_radiation, avg_ws, elevation, max_h,
     # step 4, slope of saturation vapor pressure curve
     vp_slope = saturation_vapor_pressure_curve_slope(mean_daily_temp)
 
-    # step 5, atmospheric pressure
-    pressure = atmospheric_pressure(elevation)
-
-    # step 6, psychrometric constant
-    psychrometric = psychrometric_constant(pressure)
-
     # step 7, delta term
     delta = delta_term(vp_slope, psychrometric, avg_ws)
 
@@ -149,30 +220,12 @@ def evapotranspriation(max_t, min_t, solar_radiation, avg_ws, elevation, max_h,
     # step 11.1, vapor pressure deficit
     vp_deficit = vp_curve - vp_actual
 
-    # step 12.1, relative sun earth distance
-    dist = relative_earth_sun_distance(julian_day)
-
-    # step 12.2, solar declination
-    declination = solar_declination(julian_day)
-
-    # step 13, latitude in radians
-    latitude_r = deg2rad(latitude)
-
     ## Testing solar radiation calculation
     if solar_radiation is None:
-        Rs = calc_solar_radiation(min_t, max_t, latitude_r, declination, julian_day)
+        Rs = estimate_solar_radiation(min_t, max_t, Ra_est)
     else:
         Rs = w2mj(solar_radiation)
 
-    # step 14, sunset hour angle
-    angle = sunset_hour_angle(latitude_r, declination)
-
-    # step 15, extraerrestrial radiation
-    Ra = extraterrestrial_radiation(dist, angle, latitude_r, declination)
-
-    # step 16, clear sky solar radiation
-    Rso = clear_sky_solar_radiation(elevation, Ra)
-
     # step 17, net solar radiation
     Rns = (1 - canopy_coefficient) * Rs
 
@@ -196,6 +249,192 @@ def evapotranspriation(max_t, min_t, solar_radiation, avg_ws, elevation, max_h,
     return radiation_term + wind_term
 
 
+# Extraterrestrial radiation in mega-joules/m2 for the hour starting
+# at epoch (FAO-56 equation 28).  longitude in degrees east.
+def hourly_extraterrestrial_radiation(latitude_r, longitude, epoch):
+    tm = time.gmtime(epoch)
+    julian_day = tm.tm_yday
+
+    dist = relative_earth_sun_distance(julian_day)
+    declination = solar_declination(julian_day)
+
+    # seasonal correction for solar time
+    b = 2 * math.pi * (julian_day - 81) / 364
+    Sc = 0.1645 * math.sin(2 * b) - 0.1255 * math.cos(b) - 0.025 * math.sin(b)
+
+    # solar time angle at the middle of the hour, -pi to pi
+    t = tm.tm_hour + tm.tm_min / 60.0 + 0.5
+    omega = math.pi / 12 * ((t + longitude / 15.0 + Sc) - 12)
+    omega = (omega + math.pi) % (2 * math.pi) - math.pi
+
+    # limit the hour to the time the sun is up
+    omega_s = math.acos(max(-1.0, min(1.0, -math.tan(latitude_r) * math.tan(declination))))
+    omega1 = max(omega - math.pi / 24, -omega_s)
+    omega2 = min(omega + math.pi / 24, omega_s)
+    if omega1 >= omega2:
+        return 0.0
+
+    rel1 = 12 * 60 / math.pi
+    rel2 = solarConstant * dist
+    rel3 = ((omega2 - omega1) * math.sin(latitude_r) * math.sin(declination)) + (math.cos(latitude_r) * math.cos(declination) * (math.sin(omega2) - math.sin(omega1)))
+    return rel1 * rel2 * rel3
+
+# Clear sky radiation below this (mega-joules/m2 per hour) means the
+# sun is too low for the measured / clear sky ratio to mean anything
+MIN_HOURLY_RSO = 0.5
+
+# Hourly reference ETo in mm (FAO-56 equation 53)
+#
+# temp in C
+# humidity in %
+# avg_ws in m/s
+# solar_radiation in W/m2, averaged over the hour
+# Ra is the hourly_extraterrestrial_radiation()
+# rs_rso is the relative shortwave radiation to use when the sun is too
+# low to work it out, normally the last daytime value
+#
+# Returns (ETo, the rs_rso used)
+def hourly_evapotranspiration(temp, humidity, avg_ws, solar_radiation, Ra, elevation, psychrometric, canopy_coefficient, rs_rso):
+    Rs = solar_radiation * 0.0036
+    Rso = clear_sky_solar_radiation(elevation, Ra)
+    daytime = Rso >= MIN_HOURLY_RSO
+    if daytime:
+        rs_rso = max(0.3, min(1.0, Rs / Rso))
+
+    vp_slope = saturation_vapor_pressure_curve_slope(temp)
+    vp_saturation = saturation_vapor(temp)
+    vp_actual = vp_saturation * humidity / 100
+
+    # net radiation, the hourly version of steps 17 - 19
+    Rns = (1 - canopy_coefficient) * Rs
+    Rnl = 2.043e-10 * math.pow(temp + kelvin, 4) * (0.34 - 0.14 * math.sqrt(vp_actual)) * (1.35 * rs_rso - 0.35)
+    Rn = Rns - Rnl
+
+    # soil heat flux for a grass surface
+    if daytime:
+        G = 0.1 * Rn
+    else:
+        G = 0.5 * Rn
+
+    top = 0.408 * vp_slope * (Rn - G) + psychrometric * (37 / (temp + kelvin)) * avg_ws * (vp_saturation - vp_actual)
+    bottom = vp_slope + psychrometric * (1 + 0.34 * avg_ws)
+    return (top / bottom, rs_rso)
+
+# Batch version of evapotranspriation().
+#
+# Every argument can be a single value or a list/array of values, one
+# per day (or day and location), and they're broadcast against each
+# other.  solar_radiation can be None, or have NaN entries, for the
+# days it should be estimated from the temperatures.
+#
+# canopy_coefficient can be a single value or a list of crop
+# coefficients.  With a list the result gets an extra last dimension
+# with the ETo for each coefficient.
+#
+# Days where the sun doesn't set or rise (the scalar version raises a
+# ValueError for these) come back as NaN.
+def evapotranspiration_batch(max_t, min_t, solar_radiation, avg_ws, elevation, max_h, min_h, latitude, canopy_coefficient, day):
+    if numpy is None:
+        return _evapotranspiration_loop(max_t, min_t, solar_radiation, avg_ws, elevation, max_h, min_h, latitude, canopy_coefficient, day)
+
+    np = numpy
+    max_t = np.asarray(max_t, dtype=float)
+    min_t = np.asarray(min_t, dtype=float)
+    avg_ws = np.asarray(avg_ws, dtype=float)
+    elevation = np.asarray(elevation, dtype=float)
+    max_h = np.asarray(max_h, dtype=float)
+    min_h = np.asarray(min_h, dtype=float)
+    latitude_r = np.asarray(latitude, dtype=float) * (math.pi / 180)
+    julian_day = np.asarray(day, dtype=float)
+    canopy = np.asarray(canopy_coefficient, dtype=float)
+
+    with np.errstate(invalid='ignore'):
+        mean_daily_temp = (max_t + min_t) / 2.0
+
+        es_max = 0.6108 * np.exp((enthalpy * max_t) / (max_t + vaporRate))
+        es_min = 0.6108 * np.exp((enthalpy * min_t) / (min_t + vaporRate))
+        es_mean = 0.6108 * np.exp((enthalpy * mean_daily_temp) / (mean_daily_temp + vaporRate))
+
+        vp_slope = 4098 * es_mean / (mean_daily_temp + vaporRate) ** 2
+        pressure = 101.3 * ((293 - 0.0065 * elevation) / 293) ** 5.26
+        psychrometric = 0.000665 * pressure
+
+        bottom = vp_slope + psychrometric * (1 + 0.34 * avg_ws)
+        delta = vp_slope / bottom
+        psi = psychrometric / bottom
+        t_term = 900 / (mean_daily_temp + kelvin) * avg_ws
+
+        vp_curve = (es_max + es_min) / 2
+        vp_actual = (es_min * (max_h / 100) + es_max * (min_h / 100)) / 2
+
+        angle_j = ((2 * math.pi) / 365) * julian_day
+        dist = 1 + 0.033 * np.cos(angle_j)
+        declination = 0.409 * np.sin(angle_j - 1.39)
+
+        sin_sin = np.sin(latitude_r) * np.sin(declination)
+        cos_cos = np.cos(latitude_r) * np.cos(declination)
+        tan_tan = -np.tan(latitude_r) * np.tan(declination)
+
+        # Estimated solar radiation, using the clamped sunset angle
+        omega = np.arccos(np.clip(tan_tan, -1.0, 1.0))
+        Ra_est = 24.0 / math.pi * 4.92 * dist * (omega * sin_sin + cos_cos * np.sin(omega))
+        Rs = 0.17 * np.sqrt(max_t - min_t) * Ra_est
+        if solar_radiation is not None:
+            measured = np.asarray(solar_radiation, dtype=float)
+            Rs = np.where(np.isnan(measured), Rs, measured * 0.0864)
+
+        angle = np.arccos(tan_tan)
+        Ra = 24 * 60 / math.pi * solarConstant * dist * (angle * sin_sin + cos_cos * np.sin(angle))
+        Rso = (0.75 + 2e-5 * elevation) * Ra
+
+        Rnl = (4.903e-9 * ((max_t + kelvin) ** 4 + (min_t + kelvin) ** 4) / 2 *
+               (0.34 - 0.14 * np.sqrt(vp_actual)) * (1.35 * Rs / Rso - 0.35))
+        wind_term = psi * t_term * (vp_curve - vp_actual)
+
+        # Only the net solar radiation depends on the crop coefficient
+        if canopy.ndim > 0:
+            Rs = Rs[..., np.newaxis]
+            Rnl = Rnl[..., np.newaxis]
+            delta = delta[..., np.newaxis]
+            wind_term = wind_term[..., np.newaxis]
+        Rn = (1 - canopy) * Rs - Rnl
+
+        return delta * Rn * 0.408 + wind_term
+
+# evapotranspiration_batch() for when NumPy isn't available.  Returns
+# nested lists shaped the same way.
+def _evapotranspiration_loop(max_t, min_t, solar_radiation, avg_ws, elevation, max_h, min_h, latitude, canopy_coefficient, day):
+    args = [max_t, min_t, solar_radiation, avg_ws, elevation, max_h, min_h, latitude]
+    count = 1
+    for arg in args + [day]:
+        if isinstance(arg, (list, tuple)):
+            count = max(count, len(arg))
+    scalar = count == 1 and not any(isinstance(a, (list, tuple)) for a in args + [day])
+
+    def value(arg, i):
+        if isinstance(arg, (list, tuple)):
+            return arg[i] if len(arg) > 1 else arg[0]
+        return arg
+
+    def one(i, coefficient):
+        sr = value(solar_radiation, i)
+        if sr is not None and sr != sr:   # NaN
+            sr = None
+        try:
+            return evapotranspriation(value(max_t, i), value(min_t, i), sr,
+                                      value(avg_ws, i), value(elevation, i),
+                                      value(max_h, i), value(min_h, i),
+                                      value(latitude, i), coefficient, value(day, i))
+        except ValueError:
+            return float('nan')
+
+    results = []
+    for i in range(count):
+        if isinstance(canopy_coefficient, (list, tuple)):
+            results.append([one(i, c) for c in canopy_coefficient])
+        else:
+            results.append(one(i, canopy_coefficient))
+    return results[0] if scalar else results
 
 
 if __name__ == '__main__':
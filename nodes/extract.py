@@ -0,0 +1,149 @@
+# Table driven extraction of driver values from the AERIS data.
+#
+# Each spec lists the drivers a node sets and where their values come
+# from:
+#   driver    - the node driver
+#   tag       - the tag (see uom.py) of the AERIS field
+#               holding the value, or a list of them when the value is
+#               computed from several fields.  Names that aren't tags
+#               are used as field names as is.
+#   prec      - the precision the value is rounded to
+#   transform - function applied to the field value(s).  Can be a
+#               dictionary of functions by units when the conversion
+#               depends on the units.
+#
+# compile() resolves a spec for a unit profile once, so each
+# update is a single pass over a list.  A driver whose field is
+# missing or can't be converted is skipped without affecting the
+# others.
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import time
+from nodes import weather_codes as wx
+
+LOGGER = polyinterface.LOGGER
+
+# The coded weather transforms share the decoder's cache, so a coded
+# string is only split once no matter how many drivers read it.
+def coverage(coded):
+    return wx.primary(coded)[0]
+
+def intensity(coded):
+    return wx.primary(coded)[1]
+
+def weather(coded):
+    return wx.primary(coded)[2]
+
+def average(low, high):
+    return (low + high) / 2
+
+def day_of_week(epoch):
+    return int(time.strftime("%w", time.gmtime(int(epoch))))
+
+def cm2mm(cm):
+    return float(cm) * 10
+
+OBSERVATION_SPEC = [
+        {'driver': 'CLITEMP', 'tag': 'temperature'},
+        {'driver': 'CLIHUM', 'tag': 'humidity'},
+        {'driver': 'BARPRES', 'tag': 'pressure'},
+        {'driver': 'SPEED', 'tag': 'windspeed'},
+        {'driver': 'GV5', 'tag': 'gustspeed'},
+        {'driver': 'WINDDIR', 'tag': 'winddir'},
+        {'driver': 'DISTANC', 'tag': 'visibility'},
+        {'driver': 'DEWPT', 'tag': 'dewpoint'},
+        {'driver': 'GV3', 'tag': 'heatindex'},
+        {'driver': 'GV4', 'tag': 'windchill'},
+        {'driver': 'GV2', 'tag': 'feelslike'},
+        {'driver': 'SOLRAD', 'tag': 'solarrad'},
+        {'driver': 'UV', 'tag': 'uv'},
+        {'driver': 'GV15', 'tag': 'snow'},
+        {'driver': 'GV11', 'tag': 'weatherCoded', 'transform': coverage},
+        {'driver': 'GV12', 'tag': 'weatherCoded', 'transform': intensity},
+        {'driver': 'GV13', 'tag': 'weatherCoded', 'transform': weather},
+        {'driver': 'GV14', 'tag': 'sky'},
+        ]
+
+FORECAST_SPEC = [
+        {'driver': 'CLIHUM', 'tag': ['humidity_min', 'humidity_max'], 'prec': 0, 'transform': average},
+        {'driver': 'BARPRES', 'tag': 'pressure', 'prec': 1},
+        {'driver': 'GV0', 'tag': 'temp_max', 'prec': 1},
+        {'driver': 'GV1', 'tag': 'temp_min', 'prec': 1},
+        {'driver': 'GV14', 'tag': 'sky', 'prec': 0},
+        {'driver': 'SPEED', 'tag': 'windspeed', 'prec': 1},
+        {'driver': 'GV5', 'tag': 'gustspeed', 'prec': 1},
+        {'driver': 'GV6', 'tag': 'precipitation', 'prec': 1},
+        {'driver': 'GV7', 'tag': 'wind_max', 'prec': 1},
+        {'driver': 'GV8', 'tag': 'wind_min', 'prec': 1},
+        {'driver': 'GV15', 'tag': 'snowf', 'prec': 2, 'transform': {'metric': cm2mm, 'uk': cm2mm}},
+        {'driver': 'GV19', 'tag': 'timestamp', 'transform': day_of_week},
+        {'driver': 'UV', 'tag': 'uv', 'prec': 1},
+        {'driver': 'GV18', 'tag': 'pop', 'prec': 1},
+        {'driver': 'GV11', 'tag': 'weatherPrimaryCoded', 'transform': coverage},
+        {'driver': 'GV12', 'tag': 'weatherPrimaryCoded', 'transform': intensity},
+        {'driver': 'GV13', 'tag': 'weatherPrimaryCoded', 'transform': weather},
+        ]
+
+HOURLY_SPEC = [
+        {'driver': 'CLITEMP', 'tag': 'temperature', 'prec': 1},
+        {'driver': 'CLIHUM', 'tag': 'humidity', 'prec': 0},
+        {'driver': 'SPEED', 'tag': 'windspeed', 'prec': 1},
+        {'driver': 'GV5', 'tag': 'gustspeed', 'prec': 1},
+        {'driver': 'SOLRAD', 'tag': 'solarrad', 'prec': 0},
+        {'driver': 'GV6', 'tag': 'precipitation', 'prec': 2},
+        {'driver': 'GV18', 'tag': 'pop', 'prec': 0},
+        {'driver': 'GV14', 'tag': 'sky', 'prec': 0},
+        {'driver': 'GV11', 'tag': 'weatherPrimaryCoded', 'transform': coverage},
+        {'driver': 'GV12', 'tag': 'weatherPrimaryCoded', 'transform': intensity},
+        {'driver': 'GV13', 'tag': 'weatherPrimaryCoded', 'transform': weather},
+        ]
+
+def tag_list(entry):
+    if isinstance(entry['tag'], list):
+        return entry['tag']
+    return [entry['tag']]
+
+# The AERIS field names a spec reads, in order without duplicates
+def spec_fields(spec, tags):
+    names = []
+    for entry in spec:
+        for tag in tag_list(entry):
+            name = tags.get(tag, tag)
+            if name not in names:
+                names.append(name)
+    return names
+
+class Extractor:
+    def __init__(self, spec, tags, units):
+        self.steps = []
+        for entry in spec:
+            keys = tuple([tags.get(tag, tag) for tag in tag_list(entry)])
+            transform = entry.get('transform')
+            if isinstance(transform, dict):
+                transform = transform.get(units)
+            self.steps.append((entry['driver'], keys, entry.get('prec', 3), transform))
+
+    # Return a list of (driver, value, precision) for the drivers that
+    # could be set from the record.
+    def extract(self, record):
+        values = []
+        for (driver, keys, prec, transform) in self.steps:
+            try:
+                if transform is None:
+                    value = record[keys[0]]
+                else:
+                    value = transform(*[record[key] for key in keys])
+            except KeyError as e:
+                LOGGER.debug('No %s data for driver %s' % (str(e), driver))
+                continue
+            except (TypeError, ValueError, IndexError, AttributeError) as e:
+                LOGGER.warning('Bad data for driver %s: %s' % (driver, str(e)))
+                continue
+            values.append((driver, value, prec))
+        return values
+
+def compile(spec, tags, units):
+    return Extractor(spec, tags, units)
@@ -0,0 +1,60 @@
+# AERIS response field selection
+#
+# The AERIS API returns every value in both metric and imperial units
+# along with a lot of metadata we never look at.  Asking for only the
+# fields we use (the fields= query parameter) makes the responses much
+# smaller and quicker to decode.
+#
+# The fields are the ones read by the driver tables in extract.py plus
+# the few used outside of them.
+
+from nodes import extract
+
+# Observation values used besides the drivers, by tag name
+OBSERVATION_EXTRA = [
+        'timestamp',
+        'precipitation',
+        ]
+
+# Forecast period values used besides the drivers, by tag name
+FORECAST_EXTRA = [
+        'dateTimeISO',
+        ]
+
+# Hourly forecast period values used besides the drivers, by tag name
+HOURLY_EXTRA = [
+        'timestamp',
+        'dateTimeISO',
+        ]
+
+SUMMARY_FIELDS = 'periods.summary.precip'
+
+def field_names(spec, extra, tags):
+    names = extract.spec_fields(spec, tags)
+    for tag in extra:
+        name = tags.get(tag, tag)
+        if name not in names:
+            names.append(name)
+    return names
+
+def observation_fields(tags):
+    fields = ['loc.lat', 'loc.long']
+    fields += ['ob.' + f for f in field_names(extract.OBSERVATION_SPEC, OBSERVATION_EXTRA, tags)]
+    return ','.join(fields)
+
+def forecast_fields(tags):
+    fields = ['periods.' + f for f in field_names(extract.FORECAST_SPEC, FORECAST_EXTRA, tags)]
+    return ','.join(fields)
+
+def hourly_fields(tags):
+    fields = ['periods.' + f for f in field_names(extract.HOURLY_SPEC, HOURLY_EXTRA, tags)]
+    return ','.join(fields)
+
+# Return the fields= value for each endpoint for the given tag table
+def get_fields(tags):
+    return {
+            'observations': observation_fields(tags),
+            'observations/summary': SUMMARY_FIELDS,
+            'forecasts': forecast_fields(tags),
+            'hourly': hourly_fields(tags),
+            }
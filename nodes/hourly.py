@@ -0,0 +1,68 @@
+# Hourly ETo from the hourly forecast.
+#
+# The hourly forecast periods are fed through HourlyEto one at a time
+# as they're decoded.  Each period's ETo is worked out with the FAO-56
+# hourly equation using the forecast solar radiation, and added to a
+# running total for its (local) date.  Only the totals are kept, so
+# the memory used is the same for 24 or 72 periods.
+
+from nodes import et3
+
+# Periods needed for a date's total to count as a full day.  23
+# allows for the short day when daylight saving time starts.
+MIN_HOURS = 23
+
+# Relative shortwave radiation to use for the night hours before the
+# first daytime hour has been seen
+DEFAULT_RS_RSO = 0.8
+
+class HourlyEto:
+    def __init__(self, latitude, longitude, elevation, canopy_coefficient, profile):
+        self.latitude_r = et3.deg2rad(latitude)
+        self.longitude = longitude
+        self.elevation = elevation
+        self.canopy_coefficient = canopy_coefficient
+        self.profile = profile
+        self.psychrometric = et3.psychrometric_constant(et3.atmospheric_pressure(elevation))
+        self.rs_rso = DEFAULT_RS_RSO
+        self.totals = {}
+        self.dates = []
+
+    # Work out the ETo (mm) for a period and add it to its day's total.
+    # Raises KeyError if the period is missing any of the values needed.
+    def add(self, period):
+        tags = self.profile.tags
+        temp = period[tags['temperature']]
+        humidity = period[tags['humidity']]
+        Ws = period[tags['windspeed']]
+        solar_radiation = period[tags['solarrad']]
+
+        if self.profile.temperature == 'F':
+            temp = et3.FtoC(temp)
+        if self.profile.speed == 'mph':
+            Ws = et3.mph2ms(Ws)
+        else:
+            Ws = et3.kph2ms(Ws)
+
+        Ra = et3.hourly_extraterrestrial_radiation(self.latitude_r, self.longitude, int(period['timestamp']))
+        (eto, self.rs_rso) = et3.hourly_evapotranspiration(temp, humidity, Ws, solar_radiation, Ra, self.elevation,
+                                                           self.psychrometric, self.canopy_coefficient, self.rs_rso)
+
+        # dateTimeISO is local time, so the date part is the local day
+        date = period['dateTimeISO'][:10]
+        if date not in self.totals:
+            self.totals[date] = [0.0, 0]
+            self.dates.append(date)
+        self.totals[date][0] += eto
+        self.totals[date][1] += 1
+        return eto
+
+    # Return a list of (day, ETo) for the full days seen, day being the
+    # number of days after the first date.
+    def days(self):
+        days = []
+        for (day, date) in enumerate(self.dates):
+            (total, hours) = self.totals[date]
+            if hours >= MIN_HOURS:
+                days.append((day, max(0.0, total)))
+        return days
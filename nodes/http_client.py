@@ -0,0 +1,192 @@
+# Shared HTTP client for the AERIS queries.
+#
+# All requests made by the controller go through a single requests
+# session so that the connection to api.aerisapi.com is kept alive
+# and reused between polls instead of opening a new TCP connection
+# (and doing a new DNS lookup) for every request.
+#
+# Every request has connect and read timeouts and may be given a
+# Deadline, the overall time budget for a poll cycle.  Requests
+# started after the deadline has passed are not sent and responses
+# still being read when it passes are abandoned.
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import time
+import threading
+import collections
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+
+LOGGER = polyinterface.LOGGER
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 15.0
+
+CHUNK_SIZE = 4096
+
+HttpResponse = collections.namedtuple('HttpResponse', ['status', 'headers', 'body'])
+
+# Raised when a request times out or runs past its deadline
+class RequestTimeout(Exception):
+    pass
+
+# Time budget shared by all the requests made during one poll cycle
+class Deadline:
+    def __init__(self, budget):
+        self.budget = budget
+        self.expires = time.monotonic() + budget
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+# A response body that's read a chunk at a time
+class HttpBody:
+    def __init__(self, response, chunks):
+        self.response = response
+        self.chunks = chunks
+
+    def __iter__(self):
+        return self.chunks
+
+    # Give up on the rest of the body
+    def close(self):
+        self.response.close()
+
+class HttpClient:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        self.pool_size = pool_size
+        self.connect_timeout = DEFAULT_CONNECT_TIMEOUT
+        self.read_timeout = DEFAULT_READ_TIMEOUT
+        self.session = None
+        # The client is shared by the fetch_concurrent worker threads,
+        # the session is only replaced while holding the lock.
+        self.lock = threading.Lock()
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    # Change the number of pooled connections.  The pool is rebuilt
+    # on the next request.
+    def set_pool_size(self, pool_size):
+        try:
+            pool_size = int(pool_size)
+        except (TypeError, ValueError):
+            LOGGER.warning('Invalid pool size %s, using %d' % (pool_size, DEFAULT_POOL_SIZE))
+            pool_size = DEFAULT_POOL_SIZE
+
+        if pool_size < 1:
+            pool_size = 1
+
+        if pool_size != self.pool_size:
+            LOGGER.info('Setting HTTP connection pool size to %d' % pool_size)
+            self.pool_size = pool_size
+            self.close()
+
+    def set_timeouts(self, connect, read):
+        try:
+            self.connect_timeout = float(connect)
+        except (TypeError, ValueError):
+            LOGGER.warning('Invalid connect timeout %s' % connect)
+            self.connect_timeout = DEFAULT_CONNECT_TIMEOUT
+
+        try:
+            self.read_timeout = float(read)
+        except (TypeError, ValueError):
+            LOGGER.warning('Invalid read timeout %s' % read)
+            self.read_timeout = DEFAULT_READ_TIMEOUT
+
+    def _timeout(self, deadline):
+        if deadline is None:
+            return (self.connect_timeout, self.read_timeout)
+
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            raise RequestTimeout('poll deadline exceeded')
+        return (min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+
+    # The current session, making one if needed
+    def _session(self):
+        with self.lock:
+            if self.session is None:
+                self.session = self._new_session()
+            return self.session
+
+    # Replace a session whose connections failed.  If another thread
+    # already replaced it, use that one.  Closing the old session only
+    # drops its idle connections, requests still using it finish.
+    def _reconnect(self, failed):
+        with self.lock:
+            if self.session is failed or self.session is None:
+                self.session = self._new_session()
+                failed.close()
+            return self.session
+
+    def _open(self, url, deadline):
+        session = self._session()
+        try:
+            try:
+                return session.get(url, timeout=self._timeout(deadline), stream=True)
+            except requests.exceptions.Timeout:
+                raise
+            except requests.exceptions.ConnectionError:
+                # A pooled keep-alive socket may have been closed by the
+                # server while idle between polls.  Start over with a
+                # fresh pool and try once more.
+                LOGGER.debug('Connection failed, reconnecting')
+                session = self._reconnect(session)
+                return session.get(url, timeout=self._timeout(deadline), stream=True)
+        except requests.exceptions.Timeout as e:
+            raise RequestTimeout(str(e))
+
+    # Generate the chunks of a response body as they come in
+    def _read(self, response, deadline):
+        try:
+            # The read timeout only applies to each read, so check the
+            # deadline as the body comes in.
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if deadline is not None and deadline.expired():
+                    raise RequestTimeout('poll deadline exceeded')
+                yield chunk
+        except requests.exceptions.ConnectionError as e:
+            # requests reports a read timeout while streaming the body
+            # as a connection error.
+            response.close()
+            if len(e.args) > 0 and isinstance(e.args[0], ReadTimeoutError):
+                raise RequestTimeout(str(e))
+            raise
+        except RequestTimeout:
+            # Don't hand a partially read connection back to the pool
+            response.close()
+            raise
+
+    # Send a GET request and return an HttpResponse with the
+    # complete response body.
+    def get(self, url, deadline=None):
+        response = self._open(url, deadline)
+        body = b''.join(self._read(response, deadline))
+        return HttpResponse(response.status_code, response.headers, body)
+
+    # Send a GET request and return an HttpResponse whose body is an
+    # HttpBody, read as it's iterated over.  The connection is in use
+    # until the body has been read or closed.
+    def stream(self, url, deadline=None):
+        response = self._open(url, deadline)
+        return HttpResponse(response.status_code, response.headers, HttpBody(response, self._read(response, deadline)))
+
+    def close(self):
+        with self.lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
@@ -0,0 +1,170 @@
+# Timing of the phases of a poll.
+#
+# Each phase (HTTP request, JSON decode, driver updates, ETo, ...) is
+# timed and the last WINDOW timings are kept so the median, 95th
+# percentile and maximum can be reported.  The timings, along with the
+# response sizes and decode times of each endpoint, can be written
+# to a Prometheus text format file for node_exporter's textfile
+# collector or anything else that reads that format.
+#
+# When disabled, phase() hands back a shared do nothing context so the
+# instrumented code pays almost nothing for it.
+
+import os
+import math
+import time
+import threading
+import contextlib
+import collections
+
+WINDOW = 100
+
+# Phases that are timed, in the order they're reported
+PHASES = [
+        'queue',
+        'query_conditions',
+        'query_forecast',
+        'fetch',
+        'http',
+        'decode',
+        'conditions',
+        'summary',
+        'forecasts',
+        'update_forecast',
+        'eto',
+        'hourly',
+        ]
+
+_DISABLED = contextlib.nullcontext()
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+        return False
+
+class Metrics:
+    def __init__(self, enabled=False, window=WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.totals = {}
+        self.counters = {}
+
+    def enable(self, enabled):
+        self.enabled = enabled
+
+    # Time the code in a with block as the named phase
+    def phase(self, name):
+        if not self.enabled:
+            return _DISABLED
+        return _Timer(self, name)
+
+    def record(self, name, seconds):
+        with self.lock:
+            if name not in self.timings:
+                self.timings[name] = collections.deque(maxlen=self.window)
+                self.totals[name] = [0, 0.0]
+            self.timings[name].append(seconds)
+            self.totals[name][0] += 1
+            self.totals[name][1] += seconds
+
+    # Counters are kept whether timing is enabled or not
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def counter(self, name):
+        with self.lock:
+            return self.counters.get(name, 0)
+
+    def last(self, name):
+        with self.lock:
+            if name in self.timings:
+                return self.timings[name][-1]
+            return None
+
+    # Return (p50, p95, max) of the recent timings of a phase
+    def summary(self, name):
+        with self.lock:
+            if name not in self.timings:
+                return None
+            values = sorted(self.timings[name])
+
+        return (percentile(values, 50), percentile(values, 95), values[-1])
+
+    def phases(self):
+        with self.lock:
+            names = list(self.timings.keys())
+        return [p for p in PHASES if p in names] + sorted([p for p in names if p not in PHASES])
+
+    # decode_stats, if given, adds the response sizes and decode times
+    # of each endpoint.
+    def prometheus(self, decode_stats=None):
+        lines = [
+                '# HELP aeris_phase_seconds Time taken by each phase of a poll.',
+                '# TYPE aeris_phase_seconds summary',
+                ]
+        maximums = []
+        for name in self.phases():
+            (p50, p95, maximum) = self.summary(name)
+            with self.lock:
+                (count, total) = self.totals[name]
+            lines.append('aeris_phase_seconds{phase="%s",quantile="0.5"} %.6f' % (name, p50))
+            lines.append('aeris_phase_seconds{phase="%s",quantile="0.95"} %.6f' % (name, p95))
+            lines.append('aeris_phase_seconds_sum{phase="%s"} %.6f' % (name, total))
+            lines.append('aeris_phase_seconds_count{phase="%s"} %d' % (name, count))
+            maximums.append('aeris_phase_max_seconds{phase="%s"} %.6f' % (name, maximum))
+
+        if len(maximums) > 0:
+            lines.append('# HELP aeris_phase_max_seconds Longest recent time taken by each phase of a poll.')
+            lines.append('# TYPE aeris_phase_max_seconds gauge')
+            lines += maximums
+
+        with self.lock:
+            counters = dict(self.counters)
+        for name in sorted(counters):
+            lines.append('# TYPE aeris_%s_total counter' % name)
+            lines.append('aeris_%s_total %d' % (name, counters[name]))
+
+        if decode_stats is not None:
+            endpoints = sorted(decode_stats.endpoints())
+            stats = [(endpoint, decode_stats.get(endpoint)) for endpoint in endpoints]
+            if len(stats) > 0:
+                lines.append('# HELP aeris_responses_total Responses received for each endpoint.')
+                lines.append('# TYPE aeris_responses_total counter')
+                for (endpoint, s) in stats:
+                    lines.append('aeris_responses_total{endpoint="%s"} %d' % (endpoint, s['count']))
+                lines.append('# HELP aeris_response_bytes_total Bytes received for each endpoint.')
+                lines.append('# TYPE aeris_response_bytes_total counter')
+                for (endpoint, s) in stats:
+                    lines.append('aeris_response_bytes_total{endpoint="%s"} %d' % (endpoint, s['bytes']))
+                lines.append('# HELP aeris_decode_seconds_total Time spent decoding the responses for each endpoint.')
+                lines.append('# TYPE aeris_decode_seconds_total counter')
+                for (endpoint, s) in stats:
+                    lines.append('aeris_decode_seconds_total{endpoint="%s"} %.6f' % (endpoint, s['time']))
+
+        return '\n'.join(lines) + '\n'
+
+    # Write the metrics file.  It's written to a temporary file first
+    # so readers never see a partly written file.
+    def write(self, path, decode_stats=None):
+        temp = path + '.tmp'
+        with open(temp, 'w') as f:
+            f.write(self.prometheus(decode_stats))
+        os.replace(temp, path)
+
+# Nearest rank percentile of a sorted list
+def percentile(values, pct):
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[min(len(values) - 1, max(0, rank))]
@@ -0,0 +1,306 @@
+# Refresh timing
+#
+# Works out when the forecasts and observations are worth fetching
+# again, so polls that would only download the same data are skipped.
+#
+# Forecasts
+#
+# AERIS only reissues its forecasts a few times a day, so fetching
+# them on every long poll mostly downloads the same data again.  The
+# forecast responses don't say when they were issued, so the
+# refresher works it out from when the forecast for a day changes:
+#
+#   - when the fetch before the one that saw the change was only a
+#     long poll earlier, the issue is taken to have been just after
+#     that fetch.  The gaps between these issues give the time between
+#     issues (the median of the recent ones).
+#   - once that's known, fetching starts a little before the next
+#     expected issue, allowing for how much the gaps have varied, and
+#     carries on every long poll until the forecast changes.  A new
+#     forecast is picked up as quickly as it would be fetching on
+#     every long poll.
+#   - if the forecast had already changed at the first fetch, the
+#     issue is assumed to have been a long poll earlier so the next
+#     one is looked for a little sooner.
+#
+# The forecast is also fetched again right after local midnight, when
+# the first forecast day moves on, and never goes longer than MAX_AGE
+# without being fetched.
+#
+# Day changes aren't mistaken for issues since periods are compared by
+# their timestamp, only a day that was already in the last forecast
+# and now has different data counts.
+#
+# Observations
+#
+# Stations report every so often (5, 20 or 60 minutes are common) and
+# the report shows up on AERIS a little later.  The observation
+# refresher learns the reporting interval from the gaps between
+# observation timestamps and the delay from how soon after its
+# timestamp a report was first seen, then skips polls until the next
+# report should be available.  When a report is late the station is
+# checked every short poll, backing off once several polls in a row
+# found nothing new.  Until the interval is known the station is
+# checked every short poll.
+
+import time
+import threading
+import statistics
+import collections
+
+# Seconds after midnight to fetch, giving AERIS time to move on a day
+MIDNIGHT_MARGIN = 60
+
+# Limits on the learned time between issues
+MIN_ISSUE_INTERVAL = 3600
+MAX_ISSUE_INTERVAL = 12 * 3600
+
+# Longest time to go without fetching the forecast
+MAX_AGE = 6 * 3600
+
+# Fraction of a poll interval a poll can fire early and still count,
+# so a poll firing right on time isn't skipped.
+POLL_SLACK = 0.05
+
+# Number of gaps between issues (or observations) to learn from, and
+# how many are needed before polls are skipped.
+HISTORY = 8
+MIN_GAPS = 2
+
+# Limits on the learned station reporting interval
+MIN_CADENCE = 60
+MAX_CADENCE = 3600
+
+# Unchanged observations before backing off, and the longest time to
+# back off to.
+BACKOFF_AFTER = 2
+MAX_BACKOFF = 1800
+
+class _Location:
+    def __init__(self):
+        self.last_fetch = None
+        self.periods = {}
+        self.last_issue = None
+        self.gaps = collections.deque(maxlen=HISTORY)
+        self.midnight = None
+
+class ForecastRefresher:
+    def __init__(self, interval=900):
+        self.interval = float(interval)
+        self.locations = {}
+        self.lock = threading.Lock()
+
+    # The long poll interval, used until the issue times are known
+    # and while waiting for a late issue.
+    def set_interval(self, interval):
+        self.interval = max(1.0, float(interval))
+
+    def reset(self):
+        with self.lock:
+            self.locations = {}
+
+    # Record a fetch of a location's forecast.  timestamps and hashes
+    # are the start time and content hash of each period.  Returns
+    # True if the forecast was reissued since the last fetch.
+    def record(self, location, timestamps, hashes, now=None):
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            loc = self.locations.setdefault(location, _Location())
+            periods = dict(zip(timestamps, hashes))
+            issued = False
+            for ts in periods:
+                if ts in loc.periods and loc.periods[ts] != periods[ts]:
+                    issued = True
+                    break
+            if issued and loc.last_fetch is not None:
+                if now - loc.last_fetch <= self.interval * 1.5:
+                    issue = loc.last_fetch
+                    if loc.last_issue is not None:
+                        loc.gaps.append(issue - loc.last_issue)
+                else:
+                    issue = now - self.interval
+                loc.last_issue = issue
+
+            loc.last_fetch = now
+            loc.periods = periods
+
+            # The periods run midnight to midnight local time, so the
+            # first one starting after now is the next midnight.
+            starts = sorted([int(ts) for ts in timestamps if ts is not None])
+            loc.midnight = None
+            for start in starts:
+                if start > now:
+                    loc.midnight = start
+                    break
+            if loc.midnight is None and len(starts) > 0:
+                loc.midnight = starts[-1] + 86400
+
+            return issued
+
+    # Median time between the location's issues, None until enough
+    # have been seen.
+    def issue_interval(self, location):
+        with self.lock:
+            loc = self.locations.get(location)
+            if loc is None:
+                return None
+            return self._issue_interval(loc)
+
+    def _issue_interval(self, loc):
+        if len(loc.gaps) < MIN_GAPS:
+            return None
+        return min(MAX_ISSUE_INTERVAL, max(MIN_ISSUE_INTERVAL, statistics.median(loc.gaps)))
+
+    def _next_refresh(self, loc):
+        if loc.last_fetch is None:
+            return 0
+
+        planned = loc.last_fetch + self.interval
+        interval = self._issue_interval(loc)
+        if interval is not None:
+            # Skip issues that look to have been missed altogether,
+            # AERIS sometimes reissues the same data.
+            expected = loc.last_issue + interval
+            while loc.last_fetch >= expected + interval / 2:
+                expected += interval
+            # Start looking for the next issue early enough to allow
+            # for how much the gaps between issues have varied.
+            spread = min(interval / 2, max([abs(g - interval) for g in loc.gaps]))
+            planned = max(planned, expected - spread - self.interval / 2)
+
+        if loc.midnight is not None and loc.midnight > loc.last_fetch:
+            planned = min(planned, loc.midnight + MIDNIGHT_MARGIN)
+        return min(planned, loc.last_fetch + MAX_AGE)
+
+    # When the forecasts should next be fetched, the earliest of all
+    # the locations.
+    def next_refresh(self):
+        with self.lock:
+            if len(self.locations) == 0:
+                return 0
+            return min([self._next_refresh(loc) for loc in self.locations.values()])
+
+    def due(self, now=None):
+        if now is None:
+            now = time.time()
+        return now >= self.next_refresh() - self.interval * POLL_SLACK
+
+class _Station:
+    def __init__(self):
+        self.last_fetch = None
+        self.last_ob = None
+        self.gaps = collections.deque(maxlen=HISTORY)
+        self.delays = collections.deque(maxlen=HISTORY)
+        self.unchanged = 0
+
+class ObservationRefresher:
+    def __init__(self, interval=200):
+        self.interval = float(interval)
+        self.stations = {}
+        self.lock = threading.Lock()
+
+    # The short poll interval
+    def set_interval(self, interval):
+        self.interval = max(1.0, float(interval))
+
+    def reset(self):
+        with self.lock:
+            self.stations = {}
+
+    # Record a fetch of a location's observation, timestamp is the
+    # observation's timestamp.  Returns True if it's a new one.
+    def record(self, location, timestamp, now=None):
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            st = self.stations.setdefault(location, _Station())
+            fresh = timestamp is not None and timestamp != st.last_ob
+            if fresh:
+                if st.last_ob is not None and timestamp > st.last_ob:
+                    st.gaps.append(timestamp - st.last_ob)
+                    # Only a report that wasn't there a short poll ago
+                    # says how long reports take to show up.
+                    if now - st.last_fetch <= self.interval * 1.5:
+                        st.delays.append(max(0, st.last_fetch - timestamp))
+                st.last_ob = timestamp
+                st.unchanged = 0
+            else:
+                st.unchanged += 1
+
+            st.last_fetch = now
+            return fresh
+
+    # Median time between the location's observations, None until
+    # enough have been seen.
+    def cadence(self, location):
+        with self.lock:
+            st = self.stations.get(location)
+            if st is None:
+                return None
+            return self._cadence(st)
+
+    def _cadence(self, st):
+        if len(st.gaps) < MIN_GAPS:
+            return None
+        return min(MAX_CADENCE, max(MIN_CADENCE, statistics.median(st.gaps)))
+
+    # When the next observation should be available, None if that
+    # isn't known.
+    def _expected(self, st):
+        cadence = self._cadence(st)
+        if cadence is None or st.last_ob is None:
+            return None
+        delay = 0
+        if len(st.delays) > 0:
+            delay = min(st.delays)
+        expected = st.last_ob + cadence + delay
+        # Skip reports the station looks to have missed
+        while st.last_fetch >= expected + cadence / 2:
+            expected += cadence
+        return expected
+
+    def _next_refresh(self, st):
+        if st.last_fetch is None:
+            return 0
+
+        planned = st.last_fetch + self.interval
+        expected = self._expected(st)
+        if expected is None:
+            return planned
+
+        if st.last_fetch < expected:
+            return max(planned, expected)
+
+        # The report is late, check less often the longer it takes
+        if st.unchanged >= BACKOFF_AFTER:
+            backoff = self.interval * 2 ** (st.unchanged - BACKOFF_AFTER + 1)
+            planned = st.last_fetch + min(backoff, self._cadence(st) / 2, MAX_BACKOFF)
+        return planned
+
+    # When the observations should next be fetched, the earliest of
+    # all the locations.
+    def next_refresh(self):
+        with self.lock:
+            if len(self.stations) == 0:
+                return 0
+            return min([self._next_refresh(st) for st in self.stations.values()])
+
+    def due(self, now=None):
+        if now is None:
+            now = time.time()
+        return now >= self.next_refresh() - self.interval * POLL_SLACK
+
+    # True if a new observation is expected to be available for the
+    # location by now.
+    def expecting(self, location, now=None):
+        if now is None:
+            now = time.time()
+        with self.lock:
+            st = self.stations.get(location)
+            if st is None:
+                return False
+            expected = self._expected(st)
+            return expected is not None and now >= expected
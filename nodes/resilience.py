@@ -0,0 +1,74 @@
+# Retry and circuit breaker support for the AERIS queries.
+#
+# Failed requests are retried after a randomized, exponentially
+# increasing delay so that many node servers hitting the same problem
+# don't all retry at the same moment.
+#
+# After several requests in a row have failed the circuit breaker
+# opens and no requests are sent at all for a while.  Once that time
+# is up a single trial request is allowed through; if it works the
+# breaker closes again, if not it stays open for twice as long.
+
+import time
+import random
+import threading
+
+# Full jitter exponential backoff, the delay is picked at random
+# between 0 and base * 2^attempt, limited to cap seconds.
+class Backoff:
+    def __init__(self, base=1.0, cap=30.0):
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.cap, self.base * (2 ** attempt)))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=3, reset_timeout=120.0, max_reset_timeout=3600.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_until = 0
+
+    # Return True if a request may be sent
+    def allow(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self.opened_until:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trips = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._trip()
+
+    def _trip(self):
+        timeout = min(self.max_reset_timeout, self.reset_timeout * (2 ** self.trips))
+        # Spread out the retry time so many installs don't come back
+        # at once.
+        timeout *= random.uniform(1.0, 1.5)
+        self.state = OPEN
+        self.trips += 1
+        self.opened_until = time.monotonic() + timeout
+
+    def tripped(self):
+        with self.lock:
+            return self.state != CLOSED
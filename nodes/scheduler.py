@@ -0,0 +1,141 @@
+# API quota aware poll scheduler
+#
+# AERIS plans are limited to a number of API accesses per day.  The
+# scheduler counts every access and spreads what's left of the day's
+# budget over the rest of the day, deciding when each endpoint is
+# next due.  When the budget is tight the polling intervals are
+# stretched, when there's room they return to the configured poll
+# intervals.
+#
+# The budget is shared out by weight, so observations keep getting
+# updated more often than the summary and forecasts when there isn't
+# enough for everything.
+
+import time
+import threading
+
+# Relative share of the budget each endpoint gets when there isn't
+# enough for all of them.
+DEFAULT_WEIGHTS = {
+        'observations': 4,
+        'observations/summary': 1,
+        'forecasts': 1,
+        }
+
+class QuotaScheduler:
+    def __init__(self, budget=0, weights=DEFAULT_WEIGHTS):
+        self.budget = budget
+        self.weights = dict(weights)
+        self.intervals = {}
+        self.costs = {}
+        self.next_due = {}
+        self.used = 0
+        self.day = self._today()
+        self.lock = threading.Lock()
+
+    # The AERIS access count resets at midnight UTC
+    def _today(self):
+        return time.gmtime().tm_yday
+
+    def _seconds_left_today(self):
+        now = time.time()
+        return 86400 - (now % 86400)
+
+    def _check_day(self):
+        today = self._today()
+        if today != self.day:
+            self.day = today
+            self.used = 0
+
+    def set_budget(self, budget):
+        try:
+            self.budget = max(0, int(budget))
+        except (TypeError, ValueError):
+            self.budget = 0
+
+    # The configured (shortest) interval for an endpoint, in seconds,
+    # and the number of accesses each fetch of it costs.
+    def set_interval(self, endpoint, interval, cost=1):
+        self.intervals[endpoint] = max(1.0, float(interval))
+        self.costs[endpoint] = max(1, cost)
+
+    # Stop planning for an endpoint that's no longer fetched, so it
+    # doesn't take a share of the budget.
+    def remove(self, endpoint):
+        self.intervals.pop(endpoint, None)
+        self.costs.pop(endpoint, None)
+        self.next_due.pop(endpoint, None)
+
+    # Count API accesses
+    def count(self, accesses=1):
+        with self.lock:
+            self._check_day()
+            self.used += accesses
+
+    def remaining(self):
+        with self.lock:
+            self._check_day()
+            if self.budget == 0:
+                return 0
+            return max(0, self.budget - self.used)
+
+    # Work out the interval for each endpoint that fits the rest of
+    # the day's calls into the remaining budget.
+    def plan(self):
+        with self.lock:
+            self._check_day()
+            seconds = self._seconds_left_today()
+            if self.budget == 0:
+                return dict(self.intervals)
+
+            available = float(max(0, self.budget - self.used))
+
+            # Accesses each endpoint would use at its configured interval
+            demand = {}
+            for endpoint in self.intervals:
+                demand[endpoint] = seconds / self.intervals[endpoint] * self.costs[endpoint]
+
+            # Give each endpoint its weighted share of the budget.
+            # Endpoints that need less than their share are satisfied
+            # and what they don't use is shared among the rest.
+            allocation = {}
+            unsatisfied = list(demand.keys())
+            while len(unsatisfied) > 0:
+                total_weight = sum([self.weights.get(e, 1) for e in unsatisfied])
+                satisfied = []
+                for endpoint in unsatisfied:
+                    share = available * self.weights.get(endpoint, 1) / total_weight
+                    if demand[endpoint] <= share:
+                        satisfied.append(endpoint)
+
+                if len(satisfied) == 0:
+                    for endpoint in unsatisfied:
+                        allocation[endpoint] = available * self.weights.get(endpoint, 1) / total_weight
+                    break
+
+                for endpoint in satisfied:
+                    allocation[endpoint] = demand[endpoint]
+                    available -= demand[endpoint]
+                    unsatisfied.remove(endpoint)
+
+            intervals = {}
+            for endpoint in allocation:
+                fetches = allocation[endpoint] / self.costs[endpoint]
+                if fetches < 1:
+                    # Nothing left for today
+                    intervals[endpoint] = seconds
+                else:
+                    intervals[endpoint] = max(self.intervals[endpoint], seconds / fetches)
+
+            return intervals
+
+    def due(self, endpoint):
+        return time.time() >= self.next_due.get(endpoint, 0)
+
+    # Set the next time the endpoint should be fetched
+    def schedule(self, endpoint):
+        intervals = self.plan()
+        if endpoint in intervals:
+            # Allow a little slack so a poll firing right on the
+            # interval isn't skipped.
+            self.next_due[endpoint] = time.time() + intervals[endpoint] * 0.95
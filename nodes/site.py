@@ -0,0 +1,112 @@
+# A location the node server reports weather data for.
+#
+# The controller's own Location is always the first site and its
+# current conditions are shown on the controller node.  Any extra
+# locations get their own current conditions node and set of forecast
+# nodes.  All the sites share the controller's HTTP connections,
+# response cache and batch requests.
+
+from nodes import et3
+
+MAX_SITES = 10
+
+class Site:
+    def __init__(self, name, location, elevation, plant_type, node_address, forecast_prefix):
+        self.name = name
+        self.location = location
+        self.elevation = elevation
+        self.plant_type = plant_type
+        self.node_address = node_address
+        self.forecast_prefix = forecast_prefix
+        self.latitude = 0
+        self.longitude = 0
+        self.solar = None
+        self.reset_tracking()
+
+    def forecast_address(self, day):
+        return self.forecast_prefix + str(day)
+
+    # The ETo solar table for the site, (re)built when the latitude
+    # or elevation isn't what it was built for.
+    def solar_table(self):
+        elevation = float(self.elevation)
+        if self.solar is None or not self.solar.matches(self.latitude, elevation):
+            self.solar = et3.SolarTable(self.latitude, elevation)
+        return self.solar
+
+    # Forget what was last processed so the next update isn't skipped
+    def reset_tracking(self):
+        self.last_ob_timestamp = None
+        self.last_precipitation = 0
+        self.forecast_hashes = []
+        self.forecast_values = {}
+
+    # Update the remembered values of the period shown on a forecast
+    # node after one of them was changed, value is (driver, value,
+    # precision).
+    def remember_value(self, day, value):
+        if day >= len(self.forecast_hashes):
+            return
+        values = self.forecast_values.get(self.forecast_hashes[day])
+        if values is None:
+            return
+        for i in range(0, len(values)):
+            if values[i][0] == value[0]:
+                values[i] = value
+                return
+        values.append(value)
+
+# Hash of a forecast period's contents.  context is anything else the
+# values worked out from the period depend on.  Periods holding nested
+# objects can't be hashed directly, so their text is hashed instead.
+def period_hash(period, context):
+    items = tuple(sorted(period.items()))
+    try:
+        return hash((items, context))
+    except TypeError:
+        return hash((repr(items), context))
+
+# Node addresses for the extra location number n (1 based)
+def conditions_address(n):
+    return 'conditions_' + str(n)
+
+def forecast_prefix(n):
+    return 'forecast' + str(n) + '_'
+
+"""
+    Parse the Locations parameter.  Extra locations are separated by
+    '|' and each is given as
+
+       name;location[;elevation[;plant type]]
+
+    The elevation and plant type default to the main Elevation and
+    Plant Type parameters.  For example:
+
+       cabin;44.52,-110.25;2100|office;98109
+"""
+def parse_locations(value, elevation, plant_type):
+    sites = []
+    if value is None:
+        return sites
+
+    for entry in value.split('|'):
+        entry = entry.strip()
+        if entry == '':
+            continue
+
+        parts = [p.strip() for p in entry.split(';')]
+        if len(parts) < 2 or parts[1] == '':
+            raise ValueError('location entry "' + entry + '" needs a name and location')
+
+        n = len(sites) + 1
+        if n >= MAX_SITES:
+            raise ValueError('at most %d extra locations are supported' % (MAX_SITES - 1))
+
+        site_elevation = parts[2] if len(parts) > 2 and parts[2] != '' else elevation
+        site_plant = parts[3] if len(parts) > 3 and parts[3] != '' else plant_type
+        float(site_elevation)
+        float(site_plant)
+
+        sites.append(Site(parts[0], parts[1], site_elevation, site_plant, conditions_address(n), forecast_prefix(n)))
+
+    return sites
@@ -1,120 +1,233 @@
 #
-#  Unit of Measure configuration function
+#  Unit profiles
 #
-#  Return a dictionary with driver names as the key and the UOM for
-#  the requested unit configuration.
+#  A unit profile bundles everything that depends on the Units
+#  setting: the AERIS field names (tags) to read the values from, the
+#  ISY unit of measure for each driver, the fields= lists and the
+#  compiled driver tables.
 #
 #  valid unit configurations are:
 #   metric, imperial, si (same as metric), us (same as imperial), uk
 #
+#  The profiles are built once and never change, so the controller and
+#  all the nodes share them and switching units only swaps the profile
+#  they point at.
+#
 #  Ideally, there should be no conflicts between forecast and current
 #  condition driver types
 
+import types
+from nodes import extract
+from nodes import fields
 
-def get_uom(units):
-    unit_cfg = units.lower()
+# AERIS field names by tag
+METRIC_TAGS = {
+        'temperature': 'tempC',
+        'humidity': 'humidity',
+        'pressure': 'pressureMB',
+        'windspeed': 'windSpeedKPH',
+        'gustspeed': 'windGustKPH',
+        'winddir': 'windDirDEG',
+        'visibility': 'visibilityKM',
+        'precipitation': 'precipMM',
+        'snow': 'snowDepthCM',
+        'snowf': 'snowCM',
+        'dewpoint': 'dewpointC',
+        'heatindex': 'heatindexC',
+        'windchill': 'windchillC',
+        'feelslike': 'feelslikeC',
+        'solarrad': 'solradWM2',
+        'sky': 'sky',
+        'temp_min': 'minTempC',
+        'temp_max': 'maxTempC',
+        'humidity_min': 'minHumidity',
+        'humidity_max': 'maxHumidity',
+        'wind_min': 'windSpeedMinKPH',
+        'wind_max': 'windSpeedMaxKPH',
+        'winddir_min': 'windDirMinDEG',
+        'winddir_max': 'windDirMaxDEG',
+        'uv': 'uvi',
+        'pop': 'pop',
+        'timestamp': 'timestamp',
+        'precip_summary': 'totalMM',
+        }
+
+IMPERIAL_TAGS = {
+        'temperature': 'tempF',
+        'humidity': 'humidity',
+        'pressure': 'pressureIN',
+        'windspeed': 'windSpeedMPH',
+        'gustspeed': 'windGustMPH',
+        'winddir': 'windDirDEG',
+        'visibility': 'visibilityMI',
+        'precipitation': 'precipIN',
+        'snow': 'snowDepthIN',
+        'snowf': 'snowIN',
+        'dewpoint': 'dewpointF',
+        'heatindex': 'heatindexF',
+        'windchill': 'windchillF',
+        'feelslike': 'feelslikeF',
+        'solarrad': 'solradWM2',
+        'sky': 'sky',
+        'temp_min': 'minTempF',
+        'temp_max': 'maxTempF',
+        'humidity_min': 'minHumidity',
+        'humidity_max': 'maxHumidity',
+        'wind_min': 'windSpeedMinMPH',
+        'wind_max': 'windSpeedMaxMPH',
+        'winddir_min': 'windDirMinDEG',
+        'winddir_max': 'windDirMaxDEG',
+        'uv': 'uvi',
+        'pop': 'pop',
+        'timestamp': 'timestamp',
+        'precip_summary': 'totalIN',
+        }
+
+# The UK uses metric units except for wind speed and visibility
+UK_TAGS = dict(METRIC_TAGS)
+UK_TAGS.update({
+        'windspeed': 'windSpeedMPH',
+        'gustspeed': 'windGustMPH',
+        'wind_min': 'windSpeedMinMPH',
+        'wind_max': 'windSpeedMaxMPH',
+        'visibility': 'visibilityMI',
+        })
+
+# ISY unit of measure by driver
+METRIC_UOM = {
+        'ST': 2,   # node server status
+        'CLITEMP': 4,   # temperature
+        'CLIHUM': 22,   # humidity
+        'BARPRES': 117, # pressure
+        'WINDDIR': 76,  # direction
+        'DEWPT': 4,     # dew point
+        'SOLRAD': 74,   # solar radiation
+        'RAINRT': 46,   # rain rate
+        'GV0': 4,       # max temp
+        'GV1': 4,       # min temp
+        'GV2': 4,       # ??feels like
+        'GV3': 4,       # heat index
+        'GV4': 4,       # wind chill
+        'SPEED': 32,    # wind speed
+        'GV5': 32,      # wind gusts
+        'GV6': 82,      # rain
+        'GV7': 32,      # wind max
+        'GV8': 32,      # wind min
+        'GV9': 56,      # moon phase
+        'GV10': 56,     # ozone
+        'GV11': 25,     # climate coverage
+        'GV12': 25,     # climate intensity
+        'GV13': 25,     # climate conditions
+        'GV14': 22,     # cloud conditions
+        'GV15': 82,     # snow depth
+        'GV16': 82,     # hourly ETo
+        'DISTANC': 83,  # visibility (kilometers)
+        'UV': 71,       # UV index
+        'GV17': 56,     # Air Quality
+        'GV18': 22,     # chance of precipitation
+        'GV19': 25,     # day of week
+        'GV20': 106,    # ETo
+        'GV21': 56,     # poll timeouts
+        'GV22': 45,     # data age (minutes)
+        'GV23': 56,     # remaining API quota
+        'GV24': 42,     # last poll duration (milliseconds)
+        'GV25': 56,     # request errors
+        }
 
-    if unit_cfg == 'metric' or unit_cfg == 'si' or unit_cfg.startswith('m'):
-        uom = {
-            'ST': 2,   # node server status
-            'CLITEMP': 4,   # temperature
-            'CLIHUM': 22,   # humidity
-            'BARPRES': 117, # pressure
-            'WINDDIR': 76,  # direction
-            'DEWPT': 4,     # dew point
-            'SOLRAD': 74,   # solar radiation
-            'RAINRT': 46,   # rain rate
-            'GV0': 4,       # max temp
-            'GV1': 4,       # min temp
-            'GV2': 4,       # ??feels like
-            'GV3': 4,       # heat index  
-            'GV4': 4,       # wind chill
-            'SPEED': 32,    # wind speed
-            'GV5': 32,      # wind gusts
-            'GV6': 82,      # rain
-            'GV7': 32,      # wind max
-            'GV8': 32,      # wind min  
-            'GV9': 56,      # moon phase
-            'GV10': 56,     # ozone
-            'GV11': 25,     # climate coverage
-            'GV12': 25,     # climate intensity
-            'GV13': 25,     # climate conditions
-            'GV14': 22,     # cloud conditions
-            'GV15': 82,     # snow depth
-            'DISTANC': 83,  # visibility (kilometers)
-            'UV': 71,       # UV index
-            'GV17': 56,     # Air Quality
-            'GV18': 22,     # chance of precipitation
-            'GV19': 25,     # day of week
-            'GV20': 106,    # ETo
+IMPERIAL_UOM = {
+        'ST': 2,   # node server status
+        'CLITEMP': 17,  # temperature
+        'CLIHUM': 22,   # humidity
+        'BARPRES': 23,  # pressure
+        'WINDDIR': 76,  # direction
+        'DEWPT': 17,    # dew point
+        'SOLRAD': 74,   # solar radiation
+        'RAINRT': 24,   # rain rate
+        'GV0': 17,      # max temp
+        'GV1': 17,      # min temp
+        'GV2': 17,      # feels like
+        'GV3': 17,      # ??feels like
+        'GV4': 17,      # wind chill
+        'SPEED': 48,    # wind speed
+        'GV5': 48,      # wind gusts
+        'GV6': 105,     # rain
+        'GV7': 48,      # max wind
+        'GV8': 48,      # min wind
+        'GV9': 56,      # moon phase
+        'GV10': 56,     # ozone
+        'GV11': 25,     # climate coverage
+        'GV12': 25,     # climate intensity
+        'GV13': 25,     # climate conditions
+        'GV14': 22,     # cloud conditions
+        'GV15': 105,    # snow depth
+        'GV16': 105,    # hourly ETo
+        'DISTANC': 116, # visibility
+        'UV': 71,       # UV index
+        'GV17': 56,     # Air Quality
+        'GV18': 22,     # chance of precipitation
+        'GV19': 25,     # day of week
+        'GV20': 120,    # ETo
+        'GV21': 56,     # poll timeouts
+        'GV22': 45,     # data age (minutes)
+        'GV23': 56,     # remaining API quota
+        'GV24': 42,     # last poll duration (milliseconds)
+        'GV25': 56,     # request errors
         }
-    elif unit_cfg == 'uk':
-        uom = {
-            'ST': 2,   # node server status
-            'CLITEMP': 4,   # temperature
-            'CLIHUM': 22,   # humidity
-            'BARPRES': 117, # pressure
-            'WINDDIR': 76,  # direction
-            'DEWPT': 4,     # dew point
-            'SOLRAD': 74,   # solar radiation
-            'RAINRT': 24,   # rain rate
-            'GV0': 4,       # max temp
-            'GV1': 4,       # min temp
-            'GV2': 4,       # feels like
-            'GV3': 4,       # ??feels like
-            'GV4': 4,       # wind chill
-            'SPEED': 48,    # wind speed
-            'GV5': 48,      # wind gusts
-            'GV6': 105,     # rain
-            'GV7': 48,      # max wind
-            'GV8': 48,      # min wind  
-            'GV9': 56,      # moon phase
-            'GV10': 56,     # ozone
-            'GV11': 25,     # climate coverage
-            'GV12': 25,     # climate intensity
-            'GV13': 25,     # climate conditions
-            'GV14': 22,     # cloud conditions
-            'GV15': 105,    # snow depth
-            'DISTANC': 116, # visibility
-            'UV': 71,       # UV index
-            'GV17': 56,     # Air Quality
-            'GV18': 22,     # chance of precipitation
-            'GV19': 25,     # day of week
-            'GV20': 120,    # ETo
+
+UK_UOM = dict(METRIC_UOM)
+UK_UOM.update({
+        'SPEED': 48,    # wind speed
+        'GV5': 48,      # wind gusts
+        'GV7': 48,      # max wind
+        'GV8': 48,      # min wind
+        'DISTANC': 116, # visibility
+        })
+
+class UnitProfile:
+    def __init__(self, name, tags, uom, temperature, speed, rain):
+        self.name = name
+        self.tags = types.MappingProxyType(dict(tags))
+        self.uom = types.MappingProxyType(dict(uom))
+        # Units the AERIS temperatures ('C' or 'F') and wind speeds
+        # ('kph' or 'mph') are in and the units ETo is reported in
+        # ('mm' or 'in').
+        self.temperature = temperature
+        self.speed = speed
+        self.rain = rain
+        self.fields = types.MappingProxyType(fields.get_fields(self.tags))
+        self.extractors = types.MappingProxyType({
+                'observations': extract.compile(extract.OBSERVATION_SPEC, self.tags, name),
+                'forecasts': extract.compile(extract.FORECAST_SPEC, self.tags, name),
+                'hourly': extract.compile(extract.HOURLY_SPEC, self.tags, name),
+                })
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            raise AttributeError('unit profiles can not be changed')
+        object.__setattr__(self, name, value)
+
+    def __repr__(self):
+        return 'UnitProfile(%s)' % self.name
+
+PROFILES = {
+        'metric': UnitProfile('metric', METRIC_TAGS, METRIC_UOM, 'C', 'kph', 'mm'),
+        'imperial': UnitProfile('imperial', IMPERIAL_TAGS, IMPERIAL_UOM, 'F', 'mph', 'in'),
+        'uk': UnitProfile('uk', UK_TAGS, UK_UOM, 'C', 'mph', 'mm'),
         }
-    else:
-        uom = {
-            'ST': 2,   # node server status
-            'CLITEMP': 17,  # temperature
-            'CLIHUM': 22,   # humidity
-            'BARPRES': 23,  # pressure
-            'WINDDIR': 76,  # direction
-            'DEWPT': 17,    # dew point
-            'SOLRAD': 74,   # solar radiation
-            'RAINRT': 24,   # rain rate
-            'GV0': 17,      # max temp
-            'GV1': 17,      # min temp
-            'GV2': 17,      # feels like
-            'GV3': 17,      # ??feels like
-            'GV4': 17,      # wind chill
-            'SPEED': 48,    # wind speed
-            'GV5': 48,      # wind gusts
-            'GV6': 105,     # rain
-            'GV7': 48,      # max wind
-            'GV8': 48,      # min wind   
-            'GV9': 56,      # moon phase
-            'GV10': 56,     # ozone
-            'GV11': 25,     # climate coverage
-            'GV12': 25,     # climate intensity
-            'GV13': 25,     # climate conditions
-            'GV14': 22,     # cloud conditions
-            'GV15': 105,    # snow depth
-            'DISTANC': 116, # visibility
-            'UV': 71,       # UV index
-            'GV17': 56,     # Air Quality
-            'GV18': 22,     # chance of precipitation
-            'GV19': 25,     # day of week
-            'GV20': 120,    # ETo
+
+ALIASES = {
+        'si': 'metric',
+        'us': 'imperial',
         }
 
-    return uom
+# Return the shared profile for a Units setting.  Anything that isn't
+# recognized is treated as imperial.
+def get_profile(units):
+    unit_cfg = units.lower()
+    unit_cfg = ALIASES.get(unit_cfg, unit_cfg)
+
+    if unit_cfg in PROFILES:
+        return PROFILES[unit_cfg]
+    if unit_cfg.startswith('m'):
+        return PROFILES['metric']
+    return PROFILES['imperial']
@@ -3,83 +3,110 @@ Weather code conversion functions.
 
 Convert the codes sent by the Aeris weather service
 into indexes to the NLS entries for the codes.
+
+Aeris coded weather strings look like coverage:intensity:weather,
+e.g. 'C:L:RW' for a chance of light rain showers, with several
+conditions separated by commas.  decode() splits the whole string
+once and caches the result, since the same few strings are seen
+poll after poll.
 """
 
-def weather_codes(code):
-    code_map = {
-            'A': 0,   # hail
-            'BD': 1,  # blowing dust
-            'BN': 2,  # blowing sand
-            'BR': 3,  # mist
-            'BS': 4,  # blowing snow
-            'BY': 5,  # blowing spray
-            'F': 6,   # fog
-            'FR': 7,  # frost
-            'H': 8,   # haze
-            'IC': 9,  # ice crystals
-            'IF': 10, # ice fog
-            'IP': 11, # ice pellets / Sleet
-            'K': 12,  # smoke
-            'L': 13,  # drizzle
-            'R': 14,  # rain
-            'RW': 15, # rain showers
-            'RS': 16, # rain/snow mix
-            'SI': 17, # snow/sleet mix
-            'WM': 18, # wintry mix (sno, sleet, rain)
-            'S': 19,  # snow
-            'SW': 20, # snow showers
-            'T': 21,  # Thunderstorms
-            'UP': 22, # unknown precipitation
-            'VA': 23, # volcanic ash
-            'WP': 24, # waterspouts
-            'ZF': 25, # freezing fog
-            'ZL': 26, # freezing drizzle
-            'ZR': 27, # freezing rain
-            'ZY': 28, # freezing spray
-            'CL': 29, # Clear
-            'FW': 30, # Fair/Mostly sunny
-            'SC': 31, # Partly cloudy
-            'BK': 32, # Mostly cloudy
-            'OV': 33, # Cloudy/Overcast
-            }
+import functools
+
+WEATHER_CODES = {
+        'A': 0,   # hail
+        'BD': 1,  # blowing dust
+        'BN': 2,  # blowing sand
+        'BR': 3,  # mist
+        'BS': 4,  # blowing snow
+        'BY': 5,  # blowing spray
+        'F': 6,   # fog
+        'FR': 7,  # frost
+        'H': 8,   # haze
+        'IC': 9,  # ice crystals
+        'IF': 10, # ice fog
+        'IP': 11, # ice pellets / Sleet
+        'K': 12,  # smoke
+        'L': 13,  # drizzle
+        'R': 14,  # rain
+        'RW': 15, # rain showers
+        'RS': 16, # rain/snow mix
+        'SI': 17, # snow/sleet mix
+        'WM': 18, # wintry mix (sno, sleet, rain)
+        'S': 19,  # snow
+        'SW': 20, # snow showers
+        'T': 21,  # Thunderstorms
+        'UP': 22, # unknown precipitation
+        'VA': 23, # volcanic ash
+        'WP': 24, # waterspouts
+        'ZF': 25, # freezing fog
+        'ZL': 26, # freezing drizzle
+        'ZR': 27, # freezing rain
+        'ZY': 28, # freezing spray
+        'CL': 29, # Clear
+        'FW': 30, # Fair/Mostly sunny
+        'SC': 31, # Partly cloudy
+        'BK': 32, # Mostly cloudy
+        'OV': 33, # Cloudy/Overcast
+        }
+WEATHER_UNKNOWN = 22
 
-    if code in code_map:
-        return code_map[code]
+INTENSITY_CODES = {
+        'VL': 1,  # very light
+        'L': 2,   # light
+        'H': 3,   # heavy
+        'VH': 4,  # very heavy
+        }
+INTENSITY_MODERATE = 0
 
-    return 22
+COVERAGE_CODES = {
+        'AR': 0,  # areas of
+        'BR': 1,  # brief
+        'C':  2,  # chance of
+        'D':  3,  # definite
+        'FQ': 4,  # frequent
+        'IN': 5,  # intermittent
+        'IS': 6,  # isolated
+        'L':  7,  # likely
+        'NM': 8,  # numerous
+        'O':  9,  # occasional
+        'PA': 10,  # patchy
+        'PD': 11,  # periods of
+        'S':  12,  # slight chance
+        'SC': 13,  # scattered
+        'VC': 14,  # in the vicinity/nearby
+        'WD': 15,  # widespread
+        }
+COVERAGE_NONE = 16
+
+# Number of distinct coded strings to remember
+CACHE_SIZE = 256
+
+def weather_codes(code):
+    return WEATHER_CODES.get(code, WEATHER_UNKNOWN)
 
 def intensity_codes(code):
-    code_map = {
-            'VL': 1,  # very light
-            'L': 2,   # light
-            'H': 3,   # heavy
-            'VH': 4,  # very heavy
-            }
-    if code in code_map:
-        return code_map[code]
-    return 0  # moderate
+    return INTENSITY_CODES.get(code, INTENSITY_MODERATE)
 
 def coverage_codes(code):
-    code_map = {
-            'AR': 0,  # areas of
-            'BR': 1,  # brief
-            'C':  2,  # chance of
-            'D':  3,  # definite
-            'FQ': 4,  # frequent
-            'IN': 5,  # intermittent
-            'IS': 6,  # isolated
-            'L':  7,  # likely
-            'NM': 8,  # numerous
-            'O':  9,  # occasional
-            'PA': 10,  # patchy
-            'PD': 11,  # periods of
-            'S':  12,  # slight chance
-            'SC': 13,  # scattered
-            'VC': 14,  # in the vicinity/nearby
-            'WD': 15,  # widespread
-            }
-    if code in code_map:
-        return code_map[code]
-    return 16
+    return COVERAGE_CODES.get(code, COVERAGE_NONE)
 
+# Decode a coded weather string into a tuple of (coverage, intensity,
+# weather) indexes, one for each condition in the string.  Raises
+# ValueError if a condition doesn't have all three parts.
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def decode(coded):
+    conditions = []
+    for condition in coded.split(','):
+        parts = condition.strip().split(':')
+        if len(parts) < 3:
+            raise ValueError('bad coded weather "%s"' % coded)
+        conditions.append((
+            COVERAGE_CODES.get(parts[0], COVERAGE_NONE),
+            INTENSITY_CODES.get(parts[1], INTENSITY_MODERATE),
+            WEATHER_CODES.get(parts[2], WEATHER_UNKNOWN)))
+    return tuple(conditions)
 
+# The (coverage, intensity, weather) indexes of the first condition
+def primary(coded):
+    return decode(coded)[0]
@@ -0,0 +1,95 @@
+# Background fetch worker
+#
+# Polyglot calls shortPoll, longPoll and the config and query handlers
+# on its own thread, so a slow AERIS response used to hold up
+# everything else the node server does.  Those callbacks now just
+# queue a job and a single worker thread does the fetching, works out
+# the values and updates the nodes.  Since only the worker touches the
+# nodes' data, polls, queries and configuration changes never run at
+# the same time.
+#
+# Each job has a name.  A job that's already waiting in the queue
+# isn't queued again, so when AERIS is slow the polls don't stack up
+# behind it.  At most one job of each name is waiting while another
+# runs, so nothing asked for after a job started is lost.
+#
+# Until the worker is started (and after it's stopped) jobs run on
+# the caller's thread.
+
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import time
+import queue
+import threading
+
+LOGGER = polyinterface.LOGGER
+
+class FetchWorker:
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self.queue = queue.Queue()
+        self.waiting = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='aeris-worker', daemon=True)
+            self.thread.start()
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    # Queue job, a function taking no arguments, to be run as name.
+    # Returns False if a job by that name was already waiting.
+    def submit(self, name, job):
+        if not self.running():
+            job()
+            return True
+
+        with self.lock:
+            if name in self.waiting:
+                LOGGER.debug('%s is already waiting to run' % name)
+                if self.metrics is not None:
+                    self.metrics.count('jobs_coalesced')
+                return False
+            self.waiting.add(name)
+
+        self.queue.put((name, job, time.monotonic()))
+        return True
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            (name, job, queued) = item
+            with self.lock:
+                self.waiting.discard(name)
+            if self.metrics is not None and self.metrics.enabled:
+                self.metrics.record('queue', time.monotonic() - queued)
+
+            try:
+                job()
+            except Exception as e:
+                LOGGER.error('%s failed: %s' % (name, str(e)))
+
+    # Let the job that's running finish, waiting at most timeout
+    # seconds.  Jobs still waiting are dropped.
+    def stop(self, timeout=None):
+        if self.thread is None:
+            return
+
+        with self.lock:
+            self.waiting.clear()
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None